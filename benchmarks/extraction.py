@@ -0,0 +1,85 @@
+"""CPU time saved per page by parsing HTML once for its date and text.
+
+Each page is extracted twice: the old way, with trafilatura parsing the body
+once for `extract_metadata()` and again for `extract()`, and with
+`extract_document()`, which parses it once and reads both from that tree.
+The two must agree on every page.
+
+The corpus is a sample of the `.html` files under a directory, such as the
+Rust documentation installed by `rustup`
+(`~/.rustup/toolchains/*/share/doc/rust/html`).
+
+Usage:
+
+    python benchmarks/extraction.py CORPUS_DIR [--pages 300]
+"""
+
+from __future__ import annotations
+
+import argparse
+import random
+import re
+import time
+from pathlib import Path
+from typing import Optional, Tuple
+
+import trafilatura
+
+from kmtools.action.summarize_action import extract_document
+from kmtools.util.downloader import DocumentKind, Download
+
+
+def two_parse_extraction(url: str, body: bytes) -> Tuple[Optional[str], Optional[str]]:
+    """Extract the text and date the way kmtools did before, parsing twice."""
+    metadata = trafilatura.extract_metadata(body, default_url=url)
+    date = metadata.date if metadata else None
+    text = trafilatura.extract(
+        body, favor_precision=True, output_format="txt", include_tables=False
+    )
+    if text is not None:
+        text = re.sub(r"\n[0-9]+:[0-9]+:[0-9]+\n", " ", text)
+    return text, date
+
+
+def single_parse_extraction(
+    url: str, body: bytes
+) -> Tuple[Optional[str], Optional[str]]:
+    extraction = extract_document(url, Download(body, DocumentKind.HTML), 0)
+    return extraction.text, extraction.date
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("corpus", type=Path, help="directory of HTML pages")
+    parser.add_argument("--pages", type=int, default=300)
+    args = parser.parse_args()
+
+    paths = sorted(args.corpus.rglob("*.html"))
+    if not paths:
+        raise SystemExit(f"No .html files under {args.corpus}")
+    paths = random.Random(1).sample(paths, min(args.pages, len(paths)))
+    pages = [(f"https://example.org/{path.name}", path.read_bytes()) for path in paths]
+
+    # Import and warm up trafilatura's lazily loaded parts first
+    two_parse_extraction(*pages[0])
+    single_parse_extraction(*pages[0])
+
+    results = {}
+    for label, extract in (
+        ("two parses", two_parse_extraction),
+        ("one parse", single_parse_extraction),
+    ):
+        started = time.process_time()
+        results[label] = [extract(url, body) for url, body in pages]
+        elapsed = time.process_time() - started
+        print(f"{label:10s} {elapsed * 1000 / len(pages):7.2f} ms CPU/page")
+
+    differing = sum(
+        old != new for old, new in zip(results["two parses"], results["one parse"])
+    )
+    dated = sum(1 for _, date in results["one parse"] if date)
+    print(f"{len(pages)} pages, {dated} with a date, {differing} extracted differently")
+
+
+if __name__ == "__main__":
+    main()
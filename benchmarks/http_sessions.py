@@ -0,0 +1,98 @@
+"""Handshakes saved by the pooled HTTP sessions.
+
+Runs a 200-request Wayback status polling loop against the fake services
+served over HTTPS with a throwaway self-signed certificate (made with the
+`openssl` command), first with a new connection per request as plain
+`requests.get()` makes, then through `get_http_session("wayback")`.
+
+Usage:
+
+    python benchmarks/http_sessions.py [--requests 200]
+"""
+
+from __future__ import annotations
+
+import argparse
+import ssl
+import subprocess
+import tempfile
+import time
+from pathlib import Path
+
+import requests
+
+from kmtools.util.config import Config, HttpSettings
+from kmtools.util.fake_services import FakeServices
+from kmtools.util.http_session import close_http_sessions, get_http_session
+
+
+def _self_signed_certificate(directory: Path) -> tuple[Path, Path]:
+    cert, key = directory / "cert.pem", directory / "key.pem"
+    subprocess.run(
+        ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes"]
+        + ["-keyout", str(key), "-out", str(cert), "-days", "1"]
+        + ["-subj", "/CN=127.0.0.1", "-addext", "subjectAltName=IP:127.0.0.1"],
+        check=True,
+        capture_output=True,
+    )
+    return cert, key
+
+
+def _serve_tls(fake: FakeServices, cert: Path, key: Path) -> list[int]:
+    """Wrap the fake services' socket in TLS; return a live connection count."""
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(cert, key)
+    server = fake.server
+    server.socket = context.wrap_socket(server.socket, server_side=True)
+    connections = [0]
+    accept = server.get_request
+
+    def counting_accept():
+        connections[0] += 1
+        return accept()
+
+    server.get_request = counting_accept
+    return connections
+
+
+def _run(get, url: str, count: int) -> float:
+    started = time.perf_counter()
+    for _ in range(count):
+        get(url).raise_for_status()
+    return time.perf_counter() - started
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory, FakeServices() as fake:
+        cert, key = _self_signed_certificate(Path(directory))
+        connections = _serve_tls(fake, cert, key)
+        url = fake.base_urls["wayback"].replace("http:", "https:") + (
+            "/save/status/user"
+        )
+
+        elapsed = _run(
+            lambda u: requests.get(u, verify=cert, timeout=10), url, args.requests
+        )
+        print(
+            f"new connection each: {elapsed * 1000 / args.requests:6.2f} ms/request, "
+            f"{connections[0]} connections"
+        )
+
+        connections[0] = 0
+        session = get_http_session(
+            "wayback", Config.model_construct(http=HttpSettings())
+        )
+        elapsed = _run(lambda u: session.get(u, verify=cert), url, args.requests)
+        print(
+            f"pooled session:      {elapsed * 1000 / args.requests:6.2f} ms/request, "
+            f"{connections[0]} connections"
+        )
+        close_http_sessions()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""Peak memory of a full Pinboard sync, by account size.
+
+The fake services serve `posts/all` for accounts of several sizes. For each
+size, a fresh process syncs it into an empty database with `PinboardSource`,
+and `tracemalloc` records the peak. For comparison, another process only
+loads the same response whole with `Response.json()`.
+
+The fake services run in this process, so the response they build isn't
+counted.
+
+Usage:
+
+    python benchmarks/pinboard_memory.py [--items 1000 5000 20000]
+"""
+
+from __future__ import annotations
+
+import argparse
+import multiprocessing
+import tempfile
+import tracemalloc
+from pathlib import Path
+
+from sqlalchemy import select
+
+from kmtools.models import SyncState
+from kmtools.source.pinboard import PinboardSource
+from kmtools.util import database
+from kmtools.util.config import get_config, init_config
+from kmtools.util.fake_services import FakeServices
+from kmtools.util.http_session import get_http_session
+
+
+def _configure(directory: str, base_url: str) -> None:
+    init_config(
+        kmtools={
+            "logfile": str(Path(directory) / "kmtools.log"),
+            "dbfile": str(Path(directory) / "kmtools.sqlite3"),
+            "http_cache_file": str(Path(directory) / "http_cache.sqlite3"),
+        },
+        pinboard={"api_base_url": base_url, "auth_token": "user:TOKEN"},
+    )
+
+
+def _sync(directory: str, base_url: str) -> tuple[int, int]:
+    """Return the peak traced memory of a sync, and the bookmarks it stored."""
+    _configure(directory, base_url)
+    database.get_engine()
+    tracemalloc.start()
+    PinboardSource(get_config()).run()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    with database.get_session() as session:
+        state = session.execute(select(SyncState)).scalars().one()
+        return peak, state.items_last_run
+
+
+def _load_whole(directory: str, base_url: str) -> tuple[int, int]:
+    """Return the peak traced memory of parsing the response in one go."""
+    _configure(directory, base_url)
+    session = get_http_session("pinboard")
+    tracemalloc.start()
+    with session.get(f"{base_url}/posts/all", params={"format": "json"}) as r:
+        bookmarks = r.json()
+    return tracemalloc.get_traced_memory()[1], len(bookmarks)
+
+
+def _measure(function, base_url: str) -> tuple[int, int]:
+    with (
+        tempfile.TemporaryDirectory() as directory,
+        multiprocessing.get_context("spawn").Pool(1) as pool,
+    ):
+        return pool.apply(function, (directory, base_url))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--items", type=int, nargs="+", default=[1000, 5000, 20000])
+    args = parser.parse_args()
+
+    print(f"{'bookmarks':>10s}  {'streamed sync':>14s}  {'json() alone':>14s}")
+    for items in args.items:
+        with FakeServices(items=items) as fake:
+            base_url = fake.base_urls["pinboard"]
+            synced, stored = _measure(_sync, base_url)
+            loaded, _ = _measure(_load_whole, base_url)
+        if stored != items:
+            raise SystemExit(f"Only {stored} of {items} bookmarks were stored")
+        print(f"{items:10d}  {synced / 2**20:10.1f} MiB  {loaded / 2**20:10.1f} MiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""Time the extractive summarizer over a corpus of long articles.
+
+Each article is summarized with `summarize_text()` and with a copy of the
+scorer it replaced, which checked stopwords against a list and tokenized
+each sentence again for every word. The two must agree on every article.
+
+The corpus is the `.txt` files of a directory, or generated articles if no
+directory is given.
+
+Usage:
+
+    python benchmarks/summarizer.py [--corpus DIR] [--articles 50] [--sentences 400]
+"""
+
+from __future__ import annotations
+
+import argparse
+import heapq
+import random
+import re
+import time
+from pathlib import Path
+from typing import Callable, List
+
+import nltk
+
+from kmtools.action.summarize_action import summarize_text
+from kmtools.util import nlp
+
+VOCABULARY = (
+    "the of and to in a is that for it as was with be by on not he this are or "
+    "his from at which but have an they you were her she there been one all we "
+    "library archive web link page citation memento capture crawl robust rot "
+    "drift URL data open access metadata catalog record scholar journal article "
+    "Dr. Mr. U.S. e.g. etc. it's don't o'clock 2024 (see below)"
+).split()
+
+
+def baseline_summary(raw_text: str) -> str:
+    """Summarize a text the way kmtools did before `summarize_text()`."""
+    normalized_raw_text = re.sub("[^a-zA-Z']", " ", raw_text)
+    normalized_raw_text = re.sub(r"\s+", " ", normalized_raw_text)
+
+    stopwords = nltk.corpus.stopwords.words("english")
+    word_frequencies: dict = {}
+    for word in nltk.word_tokenize(normalized_raw_text):
+        if word not in stopwords:
+            if word not in word_frequencies:
+                word_frequencies[word] = 1
+            else:
+                word_frequencies[word] += 1
+
+    maximum_frequncy = max(word_frequencies.values())
+    for word in word_frequencies:
+        word_frequencies[word] = word_frequencies[word] / maximum_frequncy
+
+    sentence_list = nltk.sent_tokenize(raw_text)
+    if len(sentence_list) < 7:
+        sorted_word_frequencies = {
+            k: v for k, v in sorted(word_frequencies.items(), key=lambda item: item[1])
+        }
+        return " ".join(list(sorted_word_frequencies.keys())[-50:])
+    sentence_scores = {}
+    for sent in sentence_list:
+        for word in nltk.word_tokenize(sent.lower()):
+            if word in word_frequencies:
+                if len(sent.split(" ")) < 30:
+                    if sent not in sentence_scores:
+                        sentence_scores[sent] = word_frequencies[word]
+                    else:
+                        sentence_scores[sent] += word_frequencies[word]
+    summary_sentences = heapq.nlargest(7, sentence_scores, key=sentence_scores.get)
+    return " ".join(summary_sentences)
+
+
+def _generated_corpus(articles: int, sentences: int) -> List[str]:
+    rng = random.Random(1)
+
+    def sentence() -> str:
+        words = rng.choices(VOCABULARY, k=rng.randint(4, 34))
+        return " ".join(words).capitalize() + rng.choice(".!?.")
+
+    corpus = []
+    for _ in range(articles):
+        article = [sentence() for _ in range(sentences)]
+        # Repeated sentences, as in transcripts and boilerplate
+        article += rng.choices(article, k=sentences // 20)
+        rng.shuffle(article)
+        corpus.append(" ".join(article))
+    return corpus
+
+
+def _time(summarize: Callable[[str], str], corpus: List[str]) -> tuple[float, list]:
+    started = time.perf_counter()
+    summaries = [summarize(text) for text in corpus]
+    return time.perf_counter() - started, summaries
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--corpus", type=Path, help="directory of .txt articles")
+    parser.add_argument("--articles", type=int, default=50)
+    parser.add_argument("--sentences", type=int, default=400)
+    args = parser.parse_args()
+
+    if args.corpus:
+        corpus = [path.read_text() for path in sorted(args.corpus.glob("*.txt"))]
+    else:
+        corpus = _generated_corpus(args.articles, args.sentences)
+    nlp.prewarm()
+
+    words = sum(len(text.split()) for text in corpus)
+    print(f"{len(corpus)} articles, {words} words")
+    baseline_elapsed, expected = _time(baseline_summary, corpus)
+    elapsed, summaries = _time(summarize_text, corpus)
+    for label, seconds in (
+        ("baseline", baseline_elapsed),
+        ("summarize_text", elapsed),
+    ):
+        print(f"{label:15s} {seconds * 1000 / len(corpus):8.2f} ms/article")
+    differing = sum(old != new for old, new in zip(expected, summaries))
+    print(f"speedup {baseline_elapsed / elapsed:.2f}x, {differing} summaries differ")
+
+
+if __name__ == "__main__":
+    main()
@@ -27,6 +27,8 @@ class ActionBase(Generic[ResourceT, StatusT]):
         - make_status(resource) -> StatusT
         - get_resource_label(resource) -> str  (for logging)
         - process(session, resource) -> None
+    Subclasses may override:
+        - prepare(session, resources) -> None  (batch work before processing)
     And the status model must have:
         - .status, .retries, .processed_at  attributes
     """
@@ -63,6 +65,13 @@ class ActionBase(Generic[ResourceT, StatusT]):
         """Perform the action on a single resource. Raise ActionError or ActionSkip as needed."""
         raise NotImplementedError
 
+    def prepare(self, session: Session, resources: List[ResourceT]) -> None:
+        """Do work for the whole batch before resources are processed one by one.
+
+        Useful for lookups that can be batched or run concurrently. Does
+        nothing by default.
+        """
+
     # -- The shared run loop --
 
     def run(self) -> None:
@@ -71,7 +80,9 @@ class ActionBase(Generic[ResourceT, StatusT]):
             logger.debug(
                 "Looking for unprocessed resources for %s", self.__class__.__name__
             )
-            resources = self.get_unprocessed(session)
+            resources = list(self.get_unprocessed(session))
+            if resources:
+                self.prepare(session, resources)
 
             for resource in resources:
                 label = self.get_resource_label(resource)
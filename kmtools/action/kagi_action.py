@@ -1,44 +1,110 @@
 import logging
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+from urllib.parse import urlsplit, urlunsplit
 
 import requests
+from sqlalchemy import func, select
 from sqlalchemy.orm import Session
 
+from kmtools.action.summarize_action import (
+    DocumentSummary,
+    SummaryResult,
+    known_content_hash,
+    stored_text,
+    summarize_many,
+    text_hash,
+)
 from kmtools.exceptions import ActionError, ActionSkip
-from kmtools.models import ActionKagi, WebResource
-from kmtools.util.config import get_config
+from kmtools.models import ActionKagi, KagiCache, KagiUsage, WebResource
+from kmtools.util.config import KagiSettings, get_config
+from kmtools.util.database import get_session
+from kmtools.util.http_session import get_http_session
 
 from .web_resource_action_base import WebResourceActionBase
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
 
+# Query parameters that only say where a link was shared from
+TRACKING_PARAMETERS = frozenset(
+    {"fbclid", "gclid", "igshid", "mc_cid", "mc_eid", "ref_src", "si"}
+)
+DEFAULT_PORTS = {"http": ":80", "https": ":443"}
 
-def get_summary(url_to_summarize: str) -> str:
+
+def normalize_url(url: str) -> str:
+    """Return the form of a URL that Kagi summaries are cached under.
+
+    The scheme and host are lowercased, and default ports, fragments and
+    tracking parameters (`utm_*` and the like) are dropped, so the same page
+    bookmarked in different places shares one summary.
+    """
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    netloc = parts.netloc.lower()
+    if scheme in DEFAULT_PORTS:
+        netloc = netloc.removesuffix(DEFAULT_PORTS[scheme])
+    query = "&".join(
+        parameter
+        for parameter in parts.query.split("&")
+        if parameter and not _is_tracking(parameter.split("=", 1)[0])
+    )
+    return urlunsplit((scheme, netloc, parts.path or "/", query, ""))
+
+
+def _is_tracking(name: str) -> bool:
+    name = name.lower()
+    return name.startswith("utm_") or name in TRACKING_PARAMETERS
+
+
+@dataclass(frozen=True)
+class KagiSummary:
+    """A summary and the tokens Kagi charged for it."""
+
+    output: str
+    tokens: int
+
+
+def request_summary(
+    url_to_summarize: str, engine: str, text: Optional[str] = None
+) -> KagiSummary:
     """Call the Kagi summarize API to retrieve summary
 
-    :param origin_url: URL to the document being summarized
+    :param url_to_summarize: URL to the document being summarized
+    :param engine: Kagi summarization engine
+    :param text: Text of the document; when given it is posted to Kagi
+        instead of the URL, and Kagi doesn't fetch the document itself
 
     :raises SummarizeError: Problem with the Kagi API
 
-    :return: Summary paragraph as returned by Kagi
+    :return: Summary paragraph as returned by Kagi, and its token count
     """
     config = get_config()
-    kagi_params = {"url": url_to_summarize}
+    kagi_params = {"url": url_to_summarize, "engine": engine}
     kagi_headers = {"Accept": "application/json"}
 
     logger.debug(
-        "Calling Kagi Summarize with %s and headers %s plus auth",
+        "Calling Kagi Summarize with %s%s and headers %s plus auth",
         kagi_params,
+        f" as {len(text)} characters of text" if text else "",
         kagi_headers,
     )
     kagi_headers["Authorization"] = f"Bot {config.kagi.api_token.get_secret_value()}"
     try:
-        r = requests.get(
-            "https://kagi.com/api/v0/summarize",
-            headers=kagi_headers,
-            params=kagi_params,
-            timeout=60,
-        )
+        if text:
+            r = get_http_session("kagi").post(
+                f"{config.kagi.api_base_url}/summarize",
+                headers=kagi_headers,
+                json={"text": text, "engine": engine},
+            )
+        else:
+            r = get_http_session("kagi").get(
+                f"{config.kagi.api_base_url}/summarize",
+                headers=kagi_headers,
+                params=kagi_params,
+            )
         logger.debug("Kagi returned code %s with %s", r.status_code, r.content)
         response_json = r.json()
     except requests.HTTPError as ex:
@@ -56,7 +122,140 @@ def get_summary(url_to_summarize: str) -> str:
     if not response_json.get("data", {}).get("output"):
         raise ActionError("Data->Output not found in JSON response")
 
-    return response_json["data"]["output"]
+    return KagiSummary(
+        response_json["data"]["output"], response_json["data"].get("tokens") or 0
+    )
+
+
+def _current_month() -> str:
+    return datetime.now(timezone.utc).strftime("%Y-%m")
+
+
+class KagiBudget:
+    """Keep Kagi spending within a per-run and a monthly budget.
+
+    The cost of each call is worked out from the tokens Kagi reports, and
+    the month's total is kept in the `kagi_usage` table. Once either budget
+    is spent no more calls are allowed for the rest of the run, so the
+    remaining resources are deferred to a later run instead of failing one
+    by one. The call that crosses a budget is allowed to finish.
+
+    :param settings: Kagi settings with the prices and budgets
+    """
+
+    def __init__(self, settings: KagiSettings) -> None:
+        self.settings = settings
+        self.run_cost = 0.0
+        self.exhausted = False
+
+    def allows(self, session: Session) -> bool:
+        """Return whether there is budget left for another call."""
+        if self.exhausted:
+            return False
+        run_budget = self.settings.run_budget
+        monthly_budget = self.settings.monthly_budget
+        if run_budget is not None and self.run_cost >= run_budget:
+            logger.warning("Kagi run budget of $%.2f is spent", run_budget)
+            self.exhausted = True
+        elif monthly_budget is not None:
+            usage = session.get(KagiUsage, _current_month())
+            if usage and usage.cost >= monthly_budget:
+                logger.warning("Kagi monthly budget of $%.2f is spent", monthly_budget)
+                self.exhausted = True
+        return not self.exhausted
+
+    def record(self, session: Session, tokens: int) -> float:
+        """Count a call against the budgets; the session is not committed.
+
+        :returns: The cost of the call
+        """
+        cost = tokens * self.settings.cost_per_1000_tokens / 1000
+        self.run_cost += cost
+        month = _current_month()
+        usage = session.get(KagiUsage, month)
+        if usage is None:
+            usage = KagiUsage(month=month, calls=0, tokens=0, cost=0.0)
+            session.add(usage)
+        usage.calls += 1
+        usage.tokens += tokens
+        usage.cost += cost
+        return cost
+
+
+def _cached_summary(session: Session, url: str, engine: str) -> Optional[KagiCache]:
+    """Return the stored summary of a normalized URL, even if it is stale."""
+    return session.scalars(
+        select(KagiCache).where(KagiCache.url == url, KagiCache.engine == engine)
+    ).first()
+
+
+def _is_fresh(cached: KagiCache, content_hash: Optional[str], ttl_days: int) -> bool:
+    """Return whether a stored summary can be used instead of calling Kagi."""
+    if content_hash and cached.content_hash not in (None, content_hash):
+        # The text changed since Kagi summarized it
+        return False
+    cutoff = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(days=ttl_days)
+    return bool(ttl_days) and cached.processed_at >= cutoff
+
+
+def summarize(
+    session: Session,
+    url_to_summarize: str,
+    budget: KagiBudget,
+    content_hash: Optional[str] = None,
+    text: Optional[str] = None,
+) -> str:
+    """Return Kagi's summary of a URL, from the cache when it is fresh.
+
+    New summaries are stored in the cache and counted against the budget;
+    the session is not committed.
+
+    :param session: SQLAlchemy session
+    :param url_to_summarize: URL to the document being summarized
+    :param budget: Budget to spend from
+    :param content_hash: Fingerprint of the document's text, if known; a
+        cached summary of different text isn't reused
+    :param text: Text of the document, to send instead of the URL
+
+    :raises ActionSkip: when the budget is spent, or Kagi can't be reached
+    :raises ActionError: when Kagi can't summarize the document
+    """
+    settings = get_config().kagi
+    url = normalize_url(url_to_summarize)
+    cached = _cached_summary(session, url, settings.engine)
+    if cached and _is_fresh(cached, content_hash, settings.cache_ttl_days):
+        logger.debug("Using Kagi summary of %s from %s", url, cached.processed_at)
+        return cached.summary
+
+    if not budget.allows(session):
+        raise ActionSkip("Kagi budget is spent; deferring")
+    result = request_summary(url_to_summarize, settings.engine, text)
+    cost = budget.record(session, result.tokens)
+    logger.debug("Kagi summary of %s cost $%.4f", url, cost)
+
+    # A stale row is updated in place; there is one per URL and engine
+    if cached is None:
+        cached = KagiCache(url=url, engine=settings.engine)
+        session.add(cached)
+    cached.summary = result.output
+    cached.content_hash = content_hash
+    cached.tokens = result.tokens
+    return result.output
+
+
+def get_summary(url_to_summarize: str) -> str:
+    """Return Kagi's summary of a URL, through the cache and monthly budget.
+
+    :param url_to_summarize: URL to the document being summarized
+
+    :return: Summary paragraph as returned by Kagi
+    """
+    settings = get_config().kagi
+    text = stored_text(url_to_summarize) if settings.send_text else None
+    with get_session() as session:
+        summary = summarize(session, url_to_summarize, KagiBudget(settings), text=text)
+        session.commit()
+    return summary
 
 
 class SummarizeWithKagiAction(WebResourceActionBase):
@@ -64,6 +263,30 @@ class SummarizeWithKagiAction(WebResourceActionBase):
 
     action_name = "KagiAction"
 
+    def __init__(self, retry_limit: int = 7) -> None:
+        super().__init__(retry_limit)
+        self.fingerprints: Dict[str, SummaryResult] = {}
+        self.engine = get_config().kagi.engine
+        self.send_text = get_config().kagi.send_text
+        self.budget = KagiBudget(get_config().kagi)
+
+    def prepare(self, session: Session, resources: List[WebResource]) -> None:
+        """Hash the text of summarized resources, so unchanged ones skip Kagi.
+
+        Resources without a stored summary will be sent to Kagi anyway, so they
+        aren't fetched here.
+        """
+        known_hashes = {}
+        for resource in resources:
+            known_hash = known_content_hash(resource.action_kagi, self.engine)
+            if known_hash:
+                known_hashes[resource.url] = known_hash
+        self.fingerprints = (
+            summarize_many(list(known_hashes), known_hashes, score=False)
+            if known_hashes
+            else {}
+        )
+
     def process(self, session: Session, resource: WebResource) -> None:
         """Get a resource summary from Kagi
 
@@ -74,11 +297,31 @@ class SummarizeWithKagiAction(WebResourceActionBase):
             - ActionException: when the attempt to post to Kagi results in an error
         """
 
-        kagi_action: ActionKagi = ActionKagi(resource=resource)
-        kagi_summary = get_summary(resource.url)
+        kagi_action: Optional[ActionKagi] = resource.action_kagi
+        known_hash = known_content_hash(kagi_action, self.engine)
+        fingerprint = self.fingerprints.get(resource.url)
+        content_hash = None
+        if isinstance(fingerprint, DocumentSummary):
+            content_hash = fingerprint.content_hash
+            if known_hash == content_hash:
+                logger.debug("Text of %s is unchanged; not asking Kagi", resource.url)
+                return None
+        text = stored_text(resource.url)
+        if content_hash is None and text is not None:
+            # Not fingerprinted; hash the text already extracted from the stored copy
+            content_hash = text_hash(text)
+        if not self.send_text:
+            text = None
+        kagi_summary = summarize(session, resource.url, self.budget, content_hash, text)
 
+        if kagi_action is None:
+            kagi_action = ActionKagi(resource=resource)
+            session.add(kagi_action)
+        else:
+            kagi_action.processed_at = func.now()
         kagi_action.kagi_summary = kagi_summary
-        session.add(kagi_action)
+        kagi_action.content_hash = content_hash
+        kagi_action.summarizer_version = self.engine
         # Note: Not committing the session here because the process_status object nees a status
         return None
 
@@ -1,126 +1,704 @@
+import functools
+import hashlib
 import heapq
+import importlib.metadata
 import logging
+import math
+import queue
 import re
-from typing import Tuple
+import threading
+import time
+from array import array
+from collections import Counter, defaultdict, deque
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Set, Tuple, Union
 
-import nltk
-import trafilatura
+import requests
+from sqlalchemy import func
 from sqlalchemy.orm import Session
-from trafilatura.settings import use_config
 
-from kmtools.exceptions import ActionError, SummarizeError
-from kmtools.models import ActionSummary, WebResource
+from kmtools.exceptions import (
+    ActionError,
+    DocumentRejectedError,
+    SummarizeError,
+    UnsupportedDocumentError,
+)
+from kmtools.models import ActionKagi, ActionSummary, WebResource
+from kmtools.util import nlp
+from kmtools.util.config import get_config
+from kmtools.util.database import get_session
+from kmtools.util.downloader import (
+    DocumentKind,
+    Download,
+    bounded_get,
+    document_kind,
+)
+from kmtools.util.http_cache import (
+    Extraction,
+    cached_get,
+    lookup_document,
+    lookup_extraction,
+    store_extraction,
+)
+from kmtools.util.pdf import read_pdf
+from kmtools.util.process_pool import limited_process_pool, run_limited
+from kmtools.util.term_index import CorpusStats, index_document, load_corpus
 
 from .web_resource_action_base import WebResourceActionBase
 
 logger = logging.getLogger(__name__)
 
+# Recorded with each summary, by summarize.mode. Bump a mode's version
+# whenever its output changes, so that re-runs rescore documents whose text
+# hasn't changed.
+SUMMARIZER_VERSIONS = {"frequency": "1", "textrank": "textrank-1"}
 
-def _get_document(resource_url: str) -> str:
-    """Use Trafilatura to get a web resource
+TEXTRANK_DAMPING = 0.85
+TEXTRANK_MAX_ITERATIONS = 50
+TEXTRANK_TOLERANCE = 1e-6
+
+# Words worth indexing: lowercase letters, possibly with apostrophes
+_TERM = re.compile(r"[a-z][a-z']*")
+
+
+def _get_document(resource_url: str) -> Download:
+    """Get a web resource through the HTTP cache
+
+    Downloads stream and stop early on documents that can't be summarized
+    (see `kmtools.util.downloader`).
 
     Args:
         resource_url (str): the web resource URL
 
     Raises:
-        SummarizeError: when trafilatura encounters an error
+        SummarizeError: when the resource can't be retrieved
+        DocumentRejectedError: when the resource is media or too large
 
     Returns:
-        str: Unicode string of document text
+        Download: Undecoded document body and how to extract its text
     """
-    trafilatura_config = use_config()
-    trafilatura_config.set(
-        "DEFAULT",
-        "USER_AGENTS",
-        "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/109.0.0.0 Safari/537.36",
-    )
-    # Fetch and extract main body of webpage from URL
-    downloaded = trafilatura.fetch_url(resource_url, config=trafilatura_config)
-    if not downloaded:
-        logger.warning("Couldn't fetch content of %s", resource_url)
+    trafilatura_config = nlp.trafilatura_config()
+    headers = {
+        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/109.0.0.0 Safari/537.36",
+    }
+    try:
+        response = cached_get(
+            resource_url,
+            headers=headers,
+            timeout=trafilatura_config.getint("DEFAULT", "DOWNLOAD_TIMEOUT"),
+            fetch=functools.partial(
+                bounded_get, max_bytes=get_config().summarize.max_document_bytes
+            ),
+        )
+    except requests.RequestException as e:
+        logger.warning("Couldn't fetch content of %s: %s", resource_url, e)
+        raise SummarizeError(f"Couldn't fetch content of {resource_url}") from e
+    if response.status_code != 200 or not response.content:
+        logger.warning(
+            "Couldn't fetch content of %s (HTTP %s)", resource_url, response.status_code
+        )
         raise SummarizeError(f"Couldn't fetch content of {resource_url}")
 
-    return downloaded
+    # Cached copies were stored whole, so route them by their stored type
+    kind = document_kind(response.headers.get("Content-Type"), response.content)
+    if kind is DocumentKind.UNSUPPORTED:
+        raise UnsupportedDocumentError(
+            f"{resource_url} is {response.headers.get('Content-Type')}"
+        )
+    content_hash = hashlib.sha256(response.content).hexdigest()
+    extractor = _extractor_name(kind, get_config().summarize.pdf_max_pages)
+    return Download(
+        response.content,
+        kind,
+        content_hash,
+        lookup_extraction(content_hash, extractor),
+    )
 
 
-def _get_derived_date(resource_url: str, downloaded) -> str:
-    metadata: dict = trafilatura.extract_metadata(
-        downloaded,
-        default_url=resource_url,
-        # date_config={"extensive_search": True},
+def stored_text(resource_url: str) -> Optional[str]:
+    """Return the text already extracted from the stored copy of a document.
+
+    Nothing is fetched or parsed: None unless the last copy fetched through
+    the HTTP cache has had its text extracted and kept.
+
+    :param resource_url: URL of the document
+    """
+    document = lookup_document(resource_url)
+    if document is None or document.status_code != 200:
+        return None
+    kind = document_kind(document.headers.get("Content-Type"), document.body)
+    if kind is DocumentKind.UNSUPPORTED:
+        return None
+    extraction = lookup_extraction(
+        document.content_hash,
+        _extractor_name(kind, get_config().summarize.pdf_max_pages),
     )
-    if metadata and metadata.date:
-        derived_date = metadata.date
-    else:
-        derived_date = "unknown"
-    return derived_date
+    return extraction.text if extraction else None
 
 
-def _get_summarization(resource_url: str, downloaded: str) -> str:
+def _store_extraction(download: Download, result: "DocumentSummary") -> None:
+    if result.extraction is None or download.content_hash is None:
+        return
+    extractor = _extractor_name(download.kind, get_config().summarize.pdf_max_pages)
+    store_extraction(download.content_hash, extractor, result.extraction)
+
+
+def _extractor_name(kind: DocumentKind, pdf_max_pages: int) -> str:
+    """Name and version of what extracts a kind of document, for the store."""
+    if kind is DocumentKind.PDF:
+        return f"pypdf {_package_version('pypdf')}, {pdf_max_pages} pages"
+    return f"trafilatura {_package_version('trafilatura')}"
+
+
+def _package_version(package: str) -> str:
+    try:
+        return importlib.metadata.version(package)
+    except importlib.metadata.PackageNotFoundError:
+        return "missing"
+
+
+def _extract_html(resource_url: str, body: bytes) -> Extraction:
+    import trafilatura  # pylint: disable=import-outside-toplevel
+    from trafilatura.utils import load_html  # pylint: disable=import-outside-toplevel
+
+    # Parse once; the metadata and the text are both read from this tree
+    tree = load_html(body)
+    if tree is None:
+        logger.info("No summarization from %s", resource_url)
+        return Extraction(text=None, date=None)
+
+    metadata = trafilatura.extract_metadata(
+        tree,
+        default_url=resource_url,
+        # date_config={"extensive_search": True},
+    )
     raw_text = trafilatura.extract(
-        downloaded,
+        tree,
         favor_precision=True,
         output_format="txt",
         include_tables=False,
     )
+    date = metadata.date if metadata else None
     if raw_text is None:
         logger.info("No summarization from %s", resource_url)
-        return None
+        return Extraction(text=None, date=date)
 
     # Remove timestamps on lines by themselves
     raw_text = re.sub(r"\n[0-9]+:[0-9]+:[0-9]+\n", " ", raw_text)
     logger.debug("raw_text=%s", raw_text)
+    return Extraction(text=raw_text, date=date)
+
 
+def extract_document(
+    resource_url: str, download: Download, pdf_max_pages: int
+) -> Extraction:
+    """Extract the main text and publication date of a document.
+
+    :param resource_url: URL of the document
+    :param download: The document
+    :param pdf_max_pages: Number of pages of a PDF to read
+    """
+    if download.kind is DocumentKind.PDF:
+        text, date = read_pdf(download.body, pdf_max_pages)
+        if text is None:
+            logger.info("No summarization from %s", resource_url)
+        return Extraction(text=text, date=date)
+    return _extract_html(resource_url, download.body)
+
+
+def text_hash(text: Optional[str]) -> str:
+    """Return the fingerprint of extracted text that is stored with summaries."""
+    return hashlib.sha256((text or "").encode("utf-8")).hexdigest()
+
+
+def known_content_hash(
+    record: Union[ActionSummary, ActionKagi, None], version: str
+) -> Optional[str]:
+    """Return the content hash of a stored summary made by this summarizer version.
+
+    :param record: The stored summary, if any
+    :param version: The current version of the summarizer that made it
+    """
+    if record is None or record.summarizer_version != version:
+        return None
+    return record.content_hash
+
+
+def _word_counts(raw_text: str) -> Counter:
     normalized_raw_text = re.sub("[^a-zA-Z']", " ", raw_text)
     normalized_raw_text = re.sub(r"\s+", " ", normalized_raw_text)
 
-    # nltk.download("stopwords")
-    # nltk.download("punkt")
-    stopwords = nltk.corpus.stopwords.words("english")
-    word_frequencies: dict = {}
-    for word in nltk.word_tokenize(normalized_raw_text):
-        if word not in stopwords:
-            if word not in word_frequencies:
-                word_frequencies[word] = 1
-            else:
-                word_frequencies[word] += 1
-
-    maximum_frequncy = max(word_frequencies.values())
-    for word in word_frequencies:
-        word_frequencies[word] = word_frequencies[word] / maximum_frequncy
-
-    sentence_list = nltk.sent_tokenize(raw_text)
+    stopwords = nlp.stopwords()
+    return Counter(
+        word for word in nlp.word_tokenize(normalized_raw_text) if word not in stopwords
+    )
+
+
+def _is_term(word: str, stopwords: Set[str]) -> bool:
+    return bool(_TERM.fullmatch(word)) and word not in stopwords
+
+
+def index_terms(word_counts: Counter) -> Set[str]:
+    """Return the distinct terms of a text for the corpus index."""
+    stopwords = nlp.stopwords()
+    terms = {word.lower() for word in word_counts}
+    return {term for term in terms if _is_term(term, stopwords)}
+
+
+def summarize_text(raw_text: str, word_counts: Optional[Counter] = None) -> str:
+    """Pick the highest-scoring sentences of a text.
+
+    Words are weighted by their frequency in the text relative to the most
+    frequent non-stopword, and a sentence of fewer than 30 words scores the
+    sum of the weights of its words. Texts of fewer than seven sentences get
+    their 50 most frequent words instead.
+
+    Each distinct sentence is tokenized once, into an array of the integer
+    IDs of its weighted words. Scores are summed word by word, in text order,
+    so that ties between sentences resolve exactly as they always have.
+
+    :param raw_text: The text
+    :param word_counts: The text's word counts, if already known
+    """
+    if word_counts is None:
+        word_counts = _word_counts(raw_text)
+    words = list(word_counts)
+    term_ids = {word: term_id for term_id, word in enumerate(words)}
+    maximum_frequency = max(word_counts.values())
+    weights = array("d", (word_counts[word] / maximum_frequency for word in words))
+
+    sentence_list = nlp.sent_tokenize(raw_text)
     if len(sentence_list) < 7:
         ## There are less than seven sentences (is this an uncorrected transcript?),
         ## so just return the 50 most popular words
-        sorted_word_frequencies = {
-            k: v for k, v in sorted(word_frequencies.items(), key=lambda item: item[1])
+        sorted_ids = sorted(range(len(words)), key=weights.__getitem__)
+        return " ".join(words[term_id] for term_id in sorted_ids[-50:])
+
+    # A sentence that appears more than once accumulates the weights of every
+    # appearance. Plain += rather than sum(), which compensates for rounding
+    # and so can reorder near-ties.
+    sentence_terms: Dict[str, array] = {}
+    sentence_scores: Dict[str, float] = {}
+    for sent in sentence_list:
+        if len(sent.split(" ")) >= 30:
+            continue
+        sent_term_ids = sentence_terms.get(sent)
+        if sent_term_ids is None:
+            sent_term_ids = sentence_terms[sent] = array(
+                "I",
+                [
+                    term_ids[word]
+                    for word in nlp.word_tokenize(sent.lower())
+                    if word in term_ids
+                ],
+            )
+        score = sentence_scores.get(sent)
+        for term_id in sent_term_ids:
+            weight = weights[term_id]
+            score = weight if score is None else score + weight
+        if score is not None:
+            sentence_scores[sent] = score
+    summary_sentences = heapq.nlargest(7, sentence_scores, key=sentence_scores.get)
+    return " ".join(summary_sentences)
+
+
+def textrank_text(
+    raw_text: str, corpus: CorpusStats, word_counts: Optional[Counter] = None
+) -> str:
+    """Pick the most central sentences of a text, weighing words by TF-IDF.
+
+    Each distinct sentence of fewer than 30 words becomes a vector of its
+    terms' frequencies times their inverse document frequency in the corpus,
+    so words common across the corpus count for little. Sentences are ranked
+    by TextRank over their cosine similarities, and the seven best are
+    returned in text order. Texts of fewer than seven sentences get their 50
+    terms of highest TF-IDF instead.
+
+    :param raw_text: The text
+    :param corpus: Snapshot of the corpus index
+    :param word_counts: The text's word counts, if already known
+    """
+    stopwords = nlp.stopwords()
+    sentence_list = nlp.sent_tokenize(raw_text)
+    if len(sentence_list) < 7:
+        if word_counts is None:
+            word_counts = _word_counts(raw_text)
+        term_counts: Counter = Counter()
+        for word, count in word_counts.items():
+            if _is_term(word.lower(), stopwords):
+                term_counts[word.lower()] += count
+        weights = {
+            term: count * corpus.idf(term) for term, count in term_counts.items()
         }
-        summarization = " ".join(list(sorted_word_frequencies.keys())[-50:])
+        return " ".join(heapq.nlargest(50, weights, key=weights.get))
+
+    sentences = [
+        sent for sent in dict.fromkeys(sentence_list) if len(sent.split(" ")) < 30
+    ]
+    postings: Dict[str, List[Tuple[int, float]]] = defaultdict(list)
+    norms: List[float] = []
+    for index, sent in enumerate(sentences):
+        term_counts = Counter(
+            word
+            for word in nlp.word_tokenize(sent.lower())
+            if _is_term(word, stopwords)
+        )
+        vector = {term: count * corpus.idf(term) for term, count in term_counts.items()}
+        for term, weight in vector.items():
+            postings[term].append((index, weight))
+        norms.append(math.sqrt(sum(weight * weight for weight in vector.values())))
+
+    # Only sentences that share a term have a similarity to accumulate
+    similarities: List[Dict[int, float]] = [defaultdict(float) for _ in sentences]
+    for posting in postings.values():
+        for position, (i, weight_i) in enumerate(posting):
+            for j, weight_j in posting[position + 1 :]:
+                similarities[i][j] += weight_i * weight_j
+                similarities[j][i] += weight_i * weight_j
+    for i, row in enumerate(similarities):
+        for j in row:
+            row[j] /= norms[i] * norms[j]
+    out_weights = [sum(row.values()) for row in similarities]
+
+    scores = [1.0] * len(sentences)
+    for _ in range(TEXTRANK_MAX_ITERATIONS):
+        new_scores = [
+            1
+            - TEXTRANK_DAMPING
+            + TEXTRANK_DAMPING
+            * sum(scores[j] * weight / out_weights[j] for j, weight in row.items())
+            for row in similarities
+        ]
+        change = max(
+            (abs(new - old) for new, old in zip(new_scores, scores)), default=0.0
+        )
+        scores = new_scores
+        if change < TEXTRANK_TOLERANCE:
+            break
+
+    best = heapq.nlargest(7, range(len(sentences)), key=scores.__getitem__)
+    return " ".join(sentences[index] for index in sorted(best))
+
+
+@dataclass
+class DocumentSummary:
+    """Summary of one document, or just its fingerprint.
+
+    `unchanged` means the text hashed to the caller's known hash, so the
+    document was neither dated nor scored. `terms` are the distinct terms of
+    a scored text, for the corpus index. `extraction` is set when the text
+    and date were newly extracted, for the document store to keep.
+    """
+
+    content_hash: str
+    derived_date: Optional[str] = None
+    summary: Optional[str] = None
+    unchanged: bool = False
+    terms: Optional[List[str]] = None
+    extraction: Optional[Extraction] = None
+
+
+def _summarize_document(
+    resource_url: str,
+    download: Download,
+    pdf_max_pages: int,
+    known_hash: Optional[str] = None,
+    score: bool = True,
+    corpus: Optional[CorpusStats] = None,
+) -> DocumentSummary:
+    extraction = download.extraction
+    fresh = None
+    if extraction is None:
+        extraction = fresh = extract_document(resource_url, download, pdf_max_pages)
+    raw_text = extraction.text
+    content_hash = text_hash(raw_text)
+    if content_hash == known_hash:
+        return DocumentSummary(content_hash, unchanged=True, extraction=fresh)
+    if not score:
+        return DocumentSummary(content_hash, extraction=fresh)
+    derived_date = extraction.date or "unknown"
+    if raw_text is None:
+        return DocumentSummary(content_hash, derived_date, extraction=fresh)
+    word_counts = _word_counts(raw_text)
+    if corpus is None:
+        summarization = summarize_text(raw_text, word_counts)
     else:
-        sentence_scores = {}
-        for sent in sentence_list:
-            for word in nltk.word_tokenize(sent.lower()):
-                if word in word_frequencies:
-                    if len(sent.split(" ")) < 30:
-                        if sent not in sentence_scores:
-                            sentence_scores[sent] = word_frequencies[word]
-                        else:
-                            sentence_scores[sent] += word_frequencies[word]
-        summary_sentences = heapq.nlargest(7, sentence_scores, key=sentence_scores.get)
-        summarization = " ".join(summary_sentences)
+        summarization = textrank_text(raw_text, corpus, word_counts)
+    terms = sorted(index_terms(word_counts))
+    return DocumentSummary(
+        content_hash, derived_date, summarization, terms=terms, extraction=fresh
+    )
 
-    return summarization
 
+# Corpus snapshot of a summarize worker process, set when the worker starts
+_worker_corpus: Optional[CorpusStats] = None
 
-def get_summary(resource_url: str) -> Tuple[str, str]:
+
+def _start_worker(corpus: Optional[CorpusStats], prewarm: bool) -> None:
+    global _worker_corpus
+    _worker_corpus = corpus
+    if prewarm:
+        nlp.prewarm()
+
+
+def _summarize_in_worker(
+    resource_url: str,
+    download: Download,
+    pdf_max_pages: int,
+    known_hash: Optional[str],
+    score: bool,
+) -> DocumentSummary:
+    return _summarize_document(
+        resource_url, download, pdf_max_pages, known_hash, score, _worker_corpus
+    )
+
+
+def _rejected_summary(
+    resource_url: str, error: DocumentRejectedError
+) -> DocumentSummary:
+    # Nothing to summarize, and trying again won't change that
+    logger.info("Not summarizing %s: %s", resource_url, error)
+    return DocumentSummary(text_hash(None), "unknown")
+
+
+def summarize_url(
+    resource_url: str,
+    known_hash: Optional[str] = None,
+    corpus: Optional[CorpusStats] = None,
+) -> DocumentSummary:
+    """Fetch and summarize one document.
+
+    :param resource_url: URL of the document
+    :param known_hash: Content hash of the stored summary, if any; the
+        document isn't scored again if its text still has this hash
+    :param corpus: Snapshot of the corpus index to score with TF-IDF and
+        TextRank, or None to score by word frequency
+
+    :raises ActionError: when the document can't be fetched
+    """
     try:
-        downloaded = _get_document(resource_url)
+        download = _get_document(resource_url)
     except SummarizeError as e:
         raise ActionError(f"Could not process {resource_url}") from e
-    derived_date: str = _get_derived_date(resource_url, downloaded)
-    summarization: str = _get_summarization(resource_url, downloaded)
-    return derived_date, summarization
+    except DocumentRejectedError as e:
+        return _rejected_summary(resource_url, e)
+    result = _summarize_document(
+        resource_url,
+        download,
+        get_config().summarize.pdf_max_pages,
+        known_hash,
+        corpus=corpus,
+    )
+    _store_extraction(download, result)
+    return result
+
+
+def _corpus_for_mode(session: Session) -> Optional[CorpusStats]:
+    if get_config().summarize.mode == "textrank":
+        return load_corpus(session)
+    return None
+
+
+def get_summary(resource_url: str) -> Tuple[str, str]:
+    with get_session() as session:
+        corpus = _corpus_for_mode(session)
+    result = summarize_url(resource_url, corpus=corpus)
+    return result.derived_date, result.summary
+
+
+@dataclass
+class StageStats:
+    """Throughput of one pipeline stage."""
+
+    name: str
+    items: int = 0
+    failures: int = 0
+    started: float = 0.0
+    finished: float = 0.0
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def record(self, failed: bool = False) -> None:
+        with self.lock:
+            now = time.monotonic()
+            self.started = self.started or now
+            self.finished = now
+            self.items += 1
+            self.failures += int(failed)
+
+    def log(self) -> None:
+        elapsed = self.finished - self.started
+        logger.info(
+            "Stage %s: %s items (%s failed) in %.1fs, %.1f per second",
+            self.name,
+            self.items,
+            self.failures,
+            elapsed,
+            self.items / elapsed if elapsed else self.items,
+        )
+
+
+_FETCHING_DONE = object()
+
+SummaryResult = Union[DocumentSummary, Exception]
+
+
+def summarize_many(
+    resource_urls: List[str],
+    known_hashes: Optional[Dict[str, str]] = None,
+    score: bool = True,
+    corpus: Optional[CorpusStats] = None,
+) -> Dict[str, SummaryResult]:
+    """Fetch and summarize many documents in a staged pipeline.
+
+    Fetching runs on a pool of threads and feeds a bounded queue. Extraction
+    and summarizing, which are CPU-bound, run in a process pool whose tasks
+    are limited in CPU time and memory (see `kmtools.util.process_pool`). A
+    task that hits a limit fails on its own; a worker that has to be killed
+    breaks the pool, which is replaced, and its tasks are tried once more.
+
+    Documents are refetched through the HTTP cache, so an unchanged page
+    costs a conditional request, and a document whose text matches its known
+    hash isn't scored again.
+
+    :param resource_urls: URLs of the documents
+    :param known_hashes: Content hashes of stored summaries, by URL
+    :param score: False to only fingerprint the documents
+    :param corpus: Snapshot of the corpus index to score with TF-IDF and
+        TextRank, or None to score by word frequency
+
+    :raises LookupError: when NLTK's Punkt sentence model isn't installed
+
+    :returns: For each URL, its summary or the exception that stopped it
+    """
+    known_hashes = known_hashes or {}
+    settings = get_config().summarize
+    # Stop before fetching anything rather than fail every document
+    nlp.require_sentence_model()
+    results: Dict[str, SummaryResult] = {}
+    started = time.monotonic()
+    fetch_stats = StageStats("fetch", started=started)
+    summarize_stats = StageStats("extract+summarize", started=started)
+
+    urls: queue.SimpleQueue = queue.SimpleQueue()
+    for url in dict.fromkeys(resource_urls):
+        urls.put(url)
+    fetched: queue.Queue = queue.Queue(maxsize=settings.queue_size)
+    fetchers_left = [settings.fetch_workers]
+    fetchers_lock = threading.Lock()
+
+    def fetch_worker() -> None:
+        try:
+            while True:
+                try:
+                    url = urls.get_nowait()
+                except queue.Empty:
+                    break
+                try:
+                    fetched.put((url, _get_document(url)))
+                    fetch_stats.record()
+                except (SummarizeError, DocumentRejectedError) as e:
+                    fetched.put((url, e))
+                    fetch_stats.record(failed=True)
+                except Exception as e:  # pylint: disable=broad-exception-caught
+                    # Fail this URL alone; the worker still owes the others
+                    logger.warning("Couldn't fetch %s: %r", url, e)
+                    fetched.put((url, e))
+                    fetch_stats.record(failed=True)
+        finally:
+            with fetchers_lock:
+                fetchers_left[0] -= 1
+                if not fetchers_left[0]:
+                    fetched.put(_FETCHING_DONE)
+
+    fetchers = [
+        threading.Thread(target=fetch_worker, name=f"fetch-{n}", daemon=True)
+        for n in range(settings.fetch_workers)
+    ]
+    for fetcher in fetchers:
+        fetcher.start()
+
+    def new_pool():
+        return limited_process_pool(
+            workers=settings.extract_workers,
+            cpu_seconds=settings.task_cpu_seconds,
+            memory_bytes=settings.task_memory_bytes,
+            tasks_per_worker=settings.tasks_per_worker,
+            warmup=functools.partial(_start_worker, corpus, settings.prewarm),
+        )
+
+    pool = new_pool()
+    ready: deque = deque()
+    in_flight: Dict[Future, Tuple[str, Download]] = {}
+    attempts: Counter = Counter()
+    fetching_done = False
+    try:
+        while True:
+            # Take fetched documents while there is room in the process pool
+            while not fetching_done and len(ready) + len(in_flight) < (
+                2 * settings.extract_workers
+            ):
+                try:
+                    item = fetched.get(timeout=None if not in_flight else 0.05)
+                except queue.Empty:
+                    break
+                if item is _FETCHING_DONE:
+                    fetching_done = True
+                elif isinstance(item[1], Exception):
+                    results[item[0]] = item[1]
+                else:
+                    ready.append(item)
+
+            while ready:
+                url, download = ready.popleft()
+                attempts[url] += 1
+                future = pool.submit(
+                    run_limited,
+                    settings.task_cpu_seconds,
+                    _summarize_in_worker,
+                    url,
+                    download,
+                    settings.pdf_max_pages,
+                    known_hashes.get(url),
+                    score,
+                )
+                in_flight[future] = (url, download)
+
+            if not in_flight:
+                if fetching_done:
+                    break
+                continue
+
+            done, _ = wait(in_flight, timeout=0.5, return_when=FIRST_COMPLETED)
+            broken = False
+            for future in done:
+                url, download = in_flight.pop(future)
+                try:
+                    results[url] = future.result()
+                    _store_extraction(download, results[url])
+                    summarize_stats.record()
+                except BrokenProcessPool:
+                    broken = True
+                    if attempts[url] < 2:
+                        ready.append((url, download))
+                    else:
+                        results[url] = SummarizeError(f"Worker died on {url}")
+                        summarize_stats.record(failed=True)
+                except Exception as e:  # pylint: disable=broad-exception-caught
+                    logger.info("Couldn't summarize %s: %s", url, e)
+                    results[url] = e
+                    summarize_stats.record(failed=True)
+            if broken:
+                logger.warning("Summarize worker died; restarting the process pool")
+                pool.shutdown(wait=False, cancel_futures=True)
+                pool = new_pool()
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+    fetch_stats.log()
+    summarize_stats.log()
+    return results
 
 
 class SummarizeAction(WebResourceActionBase):
@@ -128,6 +706,24 @@ class SummarizeAction(WebResourceActionBase):
 
     action_name = "SummarizeAction"
 
+    def __init__(self, retry_limit: int = 7) -> None:
+        super().__init__(retry_limit)
+        self.summaries: Dict[str, SummaryResult] = {}
+        self.version = SUMMARIZER_VERSIONS[get_config().summarize.mode]
+        self.corpus: Optional[CorpusStats] = None
+
+    def prepare(self, session: Session, resources: List[WebResource]) -> None:
+        """Fetch and summarize all resources in the pipeline up front."""
+        self.corpus = _corpus_for_mode(session)
+        known_hashes = {}
+        for resource in resources:
+            known_hash = known_content_hash(resource.action_summary, self.version)
+            if known_hash:
+                known_hashes[resource.url] = known_hash
+        self.summaries = summarize_many(
+            [resource.url for resource in resources], known_hashes, corpus=self.corpus
+        )
+
     def process(self, session: Session, resource: WebResource) -> None:
         """Get summary and derived date of source.
 
@@ -139,10 +735,29 @@ class SummarizeAction(WebResourceActionBase):
         """
 
         resource_url: str = resource.url
-        derived_date, summarization = get_summary(resource_url)
-        summary: ActionSummary = ActionSummary(resource=resource)
-        session.add(summary)
-        summary.derived_date = derived_date
-        summary.summary = summarization
+        summary: Optional[ActionSummary] = resource.action_summary
+        known_hash = known_content_hash(summary, self.version)
+        result = self.summaries.get(resource_url)
+        if isinstance(result, DocumentRejectedError):
+            result = _rejected_summary(resource_url, result)
+        elif isinstance(result, Exception):
+            raise ActionError(f"Could not process {resource_url}") from result
+        if result is None or (result.unchanged and result.content_hash != known_hash):
+            result = summarize_url(resource_url, known_hash, self.corpus)
+        if result.unchanged:
+            logger.debug("Text of %s is unchanged; keeping its summary", resource_url)
+            return
+
+        if summary is None:
+            summary = ActionSummary(resource=resource)
+            session.add(summary)
+        else:
+            summary.processed_at = func.now()
+        summary.derived_date = result.derived_date
+        summary.summary = result.summary
+        summary.content_hash = result.content_hash
+        summary.summarizer_version = self.version
+        if result.terms is not None:
+            index_document(session, resource.id, result.terms)
         # Note: Not committing the session here because the process_status object nees a status
         return
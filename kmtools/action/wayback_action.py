@@ -1,21 +1,39 @@
 import json
 import logging
-from typing import Tuple
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from itertools import batched
+from typing import Dict, Iterable, List, Optional, Tuple
+from urllib.parse import urlencode
 
 import requests
 from sqlalchemy import select
-from sqlalchemy.orm import Session, selectinload
+from sqlalchemy.orm import Session, contains_eager, selectinload
 
 from kmtools.exceptions import ActionError, ActionSkip
 from kmtools.models import ActionWayback, WebResource
 from kmtools.util.config import get_config
 from kmtools.util.database import get_session
+from kmtools.util.http_cache import cached_get
+from kmtools.util.http_session import get_http_session, timed_out
 
 from .web_resource_action_base import WebResourceActionBase
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
 
+# Save Page Now rejections that mean "not now" rather than "not ever"
+QUOTA_ERRORS = {
+    "error:user-session-limit",
+    "error:too-many-daily-captures",
+    "error:too-many-requests",
+}
+
+
+def _authorization(config) -> str:
+    return f"LOW {config.wayback.access_key}:{config.wayback.secret_key.get_secret_value()}"
+
 
 def _make_wayback_request(method: str, url: str, data: dict = None) -> dict:
     wayback_headers = {
@@ -34,23 +52,20 @@ def _make_wayback_request(method: str, url: str, data: dict = None) -> dict:
         logger.info("Would have archived: %s", url)
         return {}
 
-    wayback_headers["Authorization"] = (
-        f"LOW {config.wayback.access_key}:{config.wayback.secret_key.get_secret_value()}"
-    )
+    wayback_headers["Authorization"] = _authorization(config)
 
     try:
+        session = get_http_session("wayback")
         if method.lower() == "post":
-            response = requests.post(
-                url, headers=wayback_headers, data=data, timeout=10
-            )
+            response = session.post(url, headers=wayback_headers, data=data)
         elif method.lower() == "get":
-            response = requests.get(url, headers=wayback_headers, timeout=10)
+            response = session.get(url, headers=wayback_headers)
         else:
             raise ActionError("Unsupported HTTP method")
-    except requests.exceptions.ReadTimeout as ex:
-        logger.warning("Timeout connecting to Archive: %s", str(ex))
-        raise ActionSkip("Wayback API connection timeout") from ex
-    except requests.exceptions.ConnectionError as ex:
+    except (requests.exceptions.Timeout, requests.exceptions.ConnectionError) as ex:
+        if timed_out(ex):
+            logger.warning("Timeout connecting to Archive: %s", str(ex))
+            raise ActionSkip("Wayback API connection timeout") from ex
         logger.warning("Could not connect to Archive: %s", str(ex))
         raise ActionSkip("No connection to Wayback API") from ex
 
@@ -69,6 +84,10 @@ def _make_wayback_request(method: str, url: str, data: dict = None) -> dict:
         logger.error("JSON not returned; wayback response body: '%s'", response.content)
         raise ActionSkip("Non-JSON body from Wayback") from ex
 
+    if wayback_response.get("status_ext") in QUOTA_ERRORS:
+        logger.info("Save Page Now quota reached: %s", wayback_response.get("message"))
+        raise ActionSkip("Save Page Now quota reached")
+
     if wayback_response.get("status") == "error":
         logger.error(
             "Wayback returned error status; wayback response body: '%s'",
@@ -84,6 +103,180 @@ def _make_wayback_request(method: str, url: str, data: dict = None) -> dict:
     return wayback_response
 
 
+def _is_archive_url(url: str) -> bool:
+    return (
+        url.startswith("https://archive.org/")
+        or url.startswith("https://archive.is/")
+        or url.startswith("https://archive.ph/")
+    )
+
+
+def latest_capture(url: str) -> Optional[Tuple[str, str]]:
+    """Look up the newest successful Wayback capture of a URL.
+
+    Uses the CDX API through the HTTP cache, so a URL looked up again within
+    the cache lifetime costs no request.
+
+    :param url: URL to look up
+
+    :returns: Tuple of the capture timestamp and the URL as captured, or None
+        if there is no capture or the lookup failed
+    """
+    query = urlencode(
+        {
+            "url": url,
+            "output": "json",
+            "fl": "timestamp,original",
+            "filter": "statuscode:200",
+            "fastLatest": "true",
+            "limit": -1,
+        }
+    )
+    try:
+        response = cached_get(
+            f"{get_config().wayback.api_base_url}/cdx/search/cdx?{query}",
+            fetch=get_http_session("wayback").get,
+        )
+        rows = response.json() if response.status_code == 200 else None
+    except (requests.RequestException, ValueError) as ex:
+        logger.info("Couldn't look up Wayback captures of %s: %s", url, ex)
+        return None
+    # The first row holds the field names
+    if not rows or len(rows) < 2:
+        return None
+    timestamp, original = rows[-1]
+    return timestamp, original
+
+
+def _get_job_status(job_id: str) -> Optional[dict]:
+    config = get_config()
+    try:
+        response = get_http_session("wayback").get(
+            f"{config.wayback.api_base_url}/save/status/{job_id}",
+            headers={
+                "Accept": "application/json",
+                "Authorization": _authorization(config),
+            },
+        )
+        return response.json() if response.status_code == 200 else None
+    except (requests.RequestException, ValueError) as ex:
+        logger.info("Couldn't get status of %s: %s", job_id, ex)
+        return None
+
+
+def fetch_job_statuses(job_ids: List[str]) -> Dict[str, dict]:
+    """Get the status of many Save Page Now jobs.
+
+    Job ids are sent to the batch status endpoint in groups of
+    `wayback.status_batch_size`. If a batch request fails, the jobs in it
+    are looked up one at a time over parallel keep-alive requests instead.
+
+    :param job_ids: Save Page Now job identifiers
+
+    :returns: Status responses keyed by job id; jobs whose status couldn't be
+        retrieved are left out
+    """
+    config = get_config()
+    if config.dry_run or not job_ids:
+        return {}
+    headers = {"Accept": "application/json", "Authorization": _authorization(config)}
+    statuses: Dict[str, dict] = {}
+    for chunk in batched(job_ids, config.wayback.status_batch_size):
+        try:
+            response = get_http_session("wayback").post(
+                f"{config.wayback.api_base_url}/save/status",
+                headers=headers,
+                data={"job_ids": ",".join(chunk)},
+            )
+            results = response.json() if response.status_code == 200 else None
+        except (requests.RequestException, ValueError) as ex:
+            logger.info("Batch status request failed: %s", ex)
+            results = None
+
+        if not isinstance(results, list):
+            logger.debug(
+                "Falling back to single status requests for %s jobs", len(chunk)
+            )
+            with ThreadPoolExecutor(
+                max_workers=config.wayback.precheck_workers
+            ) as executor:
+                results = [
+                    result for result in executor.map(_get_job_status, chunk) if result
+                ]
+        statuses.update(
+            {result["job_id"]: result for result in results if "job_id" in result}
+        )
+    return statuses
+
+
+class CaptureScheduler:
+    """Pace Save Page Now submissions to the account's capture slots.
+
+    Save Page Now limits how many captures an account may have running at
+    once and how many it may start per day; submissions over either limit
+    are rejected. The scheduler reads the free slots from the user status
+    endpoint and hands them out. When none are free it polls until one is,
+    for at most `max_wait` seconds over the whole run; after that, and once
+    the daily allowance is used up, submissions are deferred to a later run.
+
+    :param poll_interval: Seconds between user status checks while waiting
+    :param max_wait: Total seconds to spend waiting for slots
+    """
+
+    def __init__(self, poll_interval: float, max_wait: float) -> None:
+        self.poll_interval = poll_interval
+        self.deadline = time.monotonic() + max_wait
+        self.available: Optional[int] = None
+        self.daily_remaining: Optional[int] = None
+        self.refresh()
+
+    def refresh(self) -> None:
+        """Read the free capture slots; leave submissions unpaced on failure."""
+        config = get_config()
+        if config.dry_run:
+            return
+        try:
+            response = get_http_session("wayback").get(
+                f"{config.wayback.api_base_url}/save/status/user",
+                headers={
+                    "Accept": "application/json",
+                    "Authorization": _authorization(config),
+                },
+            )
+            status = response.json() if response.status_code == 200 else {}
+        except (requests.RequestException, ValueError) as ex:
+            logger.info("Couldn't get Save Page Now user status: %s", ex)
+            status = {}
+        self.available = status.get("available")
+        if "daily_captures_limit" in status:
+            self.daily_remaining = status["daily_captures_limit"] - status.get(
+                "daily_captures", 0
+            )
+        logger.debug(
+            "Save Page Now slots available: %s; daily captures left: %s",
+            self.available,
+            self.daily_remaining,
+        )
+
+    def acquire(self) -> bool:
+        """Take a capture slot, waiting for one if needed.
+
+        :returns: False if the submission should be deferred
+        """
+        if self.daily_remaining is not None and self.daily_remaining <= 0:
+            return False
+        while self.available is not None and self.available <= 0:
+            if time.monotonic() + self.poll_interval > self.deadline:
+                return False
+            time.sleep(self.poll_interval)
+            self.refresh()
+        if self.available is not None:
+            self.available -= 1
+        if self.daily_remaining is not None:
+            self.daily_remaining -= 1
+        return True
+
+
 class SaveToWaybackAction(WebResourceActionBase):
     """Save a URL to the WayBack machine
 
@@ -96,6 +289,49 @@ class SaveToWaybackAction(WebResourceActionBase):
 
     action_name = "WaybackSaveAction"
 
+    def __init__(self, retry_limit: int = 7) -> None:
+        super().__init__(retry_limit)
+        self.recent_captures: Dict[int, Tuple[str, str]] = {}
+        self.scheduler: Optional[CaptureScheduler] = None
+
+    def prepare(self, session: Session, resources: List[WebResource]) -> None:
+        """Find resources the Wayback Machine already captured recently.
+
+        Those get the existing capture recorded instead of a Save Page Now
+        job. The CDX lookups run concurrently. If any resources are left to
+        submit, also starts the scheduler that paces their submissions.
+        """
+        settings = get_config().wayback
+        self.scheduler = None
+        self.recent_captures = {}
+        candidates = {
+            resource.id: resource.url
+            for resource in resources
+            if not _is_archive_url(resource.url)
+        }
+        if settings.max_capture_age_days and candidates:
+            cutoff = (
+                datetime.now(timezone.utc)
+                - timedelta(days=settings.max_capture_age_days)
+            ).strftime("%Y%m%d%H%M%S")
+            with ThreadPoolExecutor(max_workers=settings.precheck_workers) as executor:
+                captures = executor.map(latest_capture, candidates.values())
+                for resource_id, capture in zip(candidates, captures):
+                    if capture and capture[0] >= cutoff:
+                        self.recent_captures[resource_id] = capture
+            logger.info(
+                "%s of %s resources have a Wayback capture newer than %s",
+                len(self.recent_captures),
+                len(candidates),
+                cutoff,
+            )
+
+        # Reading the free slots costs a request; skip it when nothing is sent
+        if any(resource_id not in self.recent_captures for resource_id in candidates):
+            self.scheduler = CaptureScheduler(
+                settings.slot_poll_interval, settings.max_slot_wait
+            )
+
     @staticmethod
     def _wayback_save_page_now(url_to_save: str) -> str:
         """Save page to WayBack machine.
@@ -105,11 +341,7 @@ class SaveToWaybackAction(WebResourceActionBase):
         :returns: Identifier of the Save Page Now request
         """
         ## This conditional effectively skips saving Internet Archive URLs into wayback
-        if (
-            url_to_save.startswith("https://archive.org/")
-            or url_to_save.startswith("https://archive.is/")
-            or url_to_save.startswith("https://archive.ph/")
-        ):
+        if _is_archive_url(url_to_save):
             return url_to_save
 
         wayback_body = {
@@ -119,7 +351,7 @@ class SaveToWaybackAction(WebResourceActionBase):
             "skip_first_archive": 1,
             "email_result": 0,
         }
-        wayback_endpoint = "https://web.archive.org/save"
+        wayback_endpoint = f"{get_config().wayback.api_base_url}/save"
 
         wayback_response = _make_wayback_request(
             method="post", url=wayback_endpoint, data=wayback_body
@@ -142,9 +374,31 @@ class SaveToWaybackAction(WebResourceActionBase):
         """
 
         wayback_action: ActionWayback = ActionWayback(resource=resource)
-        spn_identifier = SaveToWaybackAction._wayback_save_page_now(resource.url)
-
-        wayback_action.wayback_url = spn_identifier
+        capture = self.recent_captures.get(resource.id)
+        if capture:
+            # A URL instead of an SPN identifier tells ResultsFromWaybackAction
+            # there is nothing left to wait for
+            timestamp, original_url = capture
+            logger.info(
+                "Reusing Wayback capture of %s from %s", original_url, timestamp
+            )
+            wayback_action.wayback_url = (
+                f"https://web.archive.org/{timestamp}/{original_url}"
+            )
+            wayback_action.wayback_timestamp = timestamp
+            wayback_action.wayback_details = json.dumps(
+                {"source": "cdx", "timestamp": timestamp, "original_url": original_url}
+            )
+        else:
+            if (
+                not _is_archive_url(resource.url)
+                and self.scheduler
+                and not self.scheduler.acquire()
+            ):
+                raise ActionSkip("No Save Page Now capture slot free; deferring")
+            wayback_action.wayback_url = SaveToWaybackAction._wayback_save_page_now(
+                resource.url
+            )
         session.add(wayback_action)
         # Note: Not committing the session here because the process_status object needs a status
         return
@@ -161,29 +415,89 @@ class ResultsFromWaybackAction(WebResourceActionBase):
 
     action_name = "WaybackResultsAction"
 
+    def __init__(self, retry_limit: int = 7) -> None:
+        super().__init__(retry_limit)
+        self.job_statuses: Dict[str, dict] = {}
+
+    def prepare(self, session: Session, resources: List[WebResource]) -> None:
+        """Poll the status of every outstanding Save Page Now job at once.
+
+        Jobs still pending are polled again after each of the
+        `wayback.status_poll_delays`; whatever is pending after that is
+        skipped this run and polled again on the next.
+        """
+        settings = get_config().wayback
+        pending = [
+            resource.action_wayback.wayback_url
+            for resource in resources
+            if resource.action_wayback
+            and resource.action_wayback.wayback_url
+            and resource.action_wayback.wayback_url.startswith("spn")
+        ]
+        self.job_statuses = {}
+        delays = iter(settings.status_poll_delays)
+        while pending:
+            self.job_statuses.update(fetch_job_statuses(pending))
+            pending = [
+                job_id
+                for job_id in pending
+                if self.job_statuses.get(job_id, {}).get("status") == "pending"
+            ]
+            delay = next(delays, None)
+            if not pending or delay is None:
+                break
+            logger.debug("%s jobs pending; polling again in %ss", len(pending), delay)
+            time.sleep(delay)
+        logger.info(
+            "Polled %s Save Page Now jobs; %s still pending",
+            len(self.job_statuses),
+            len(pending),
+        )
+
     @staticmethod
-    def _wayback_retrieve_status(spn_identifier) -> Tuple[str, str, str]:
+    def _wayback_retrieve_status(
+        spn_identifier, wayback_response: Optional[dict] = None
+    ) -> Tuple[str, str, str]:
         """Retrieve results of save-page-now request from Wayback
 
         :param spn_identifier:  Identifier for the save-page-now request
+        :param wayback_response:  Status already retrieved by a batch poll; if
+            None, the status is requested now
 
         :returns Tuple:
             - Wayback URL to the saved page
             - Date at which Wayback finished saving the page
             - Details from Wayback about what was stored
+
+        :raises:
+            - ActionSkip: when the job is still pending
+            - ActionError: when the job failed or the response is malformed
         """
         if not spn_identifier:
             return None
 
-        wayback_endpoint = f"https://web.archive.org/save/status/{spn_identifier}"
-
-        wayback_response = _make_wayback_request(method="get", url=wayback_endpoint)
+        if wayback_response is None:
+            wayback_endpoint = (
+                f"{get_config().wayback.api_base_url}/save/status/{spn_identifier}"
+            )
+            wayback_response = _make_wayback_request(method="get", url=wayback_endpoint)
 
         wayback_job = wayback_response["job_id"]
         if "message" in wayback_response:
             logger.warning("Wayback said: %s", wayback_response["message"])
 
         wayback_status = wayback_response["status"]
+        if wayback_status == "pending":
+            raise ActionSkip(f"Save Page Now job {wayback_job} still pending")
+        if wayback_status == "error":
+            logger.error(
+                "Save Page Now job %s failed: %s",
+                wayback_job,
+                wayback_response.get("status_ext"),
+            )
+            raise ActionError(
+                f"Wayback job failed: {wayback_response.get('status_ext')}"
+            )
         wayback_original_url = wayback_response.get("original_url")
         wayback_timestamp = wayback_response.get("timestamp")
         wayback_url = (
@@ -221,7 +535,8 @@ class ResultsFromWaybackAction(WebResourceActionBase):
         edited to remove the SPN identifier.
 
         :raises:
-            - ActionException: when the SPN request isn't finished
+            - ActionSkip: when the SPN request isn't finished
+            - ActionError: when the SPN request failed
         """
 
         ## If there is no process_status record yet, then we have nothing to check. Tell
@@ -237,7 +552,7 @@ class ResultsFromWaybackAction(WebResourceActionBase):
         if not spn_identifier or not spn_identifier.startswith("spn"):
             return
         wayback_url, wayback_timestamp, wayback_details = self._wayback_retrieve_status(
-            spn_identifier
+            spn_identifier, self.job_statuses.get(spn_identifier)
         )
 
         wayback_action.wayback_url = wayback_url
@@ -247,6 +562,32 @@ class ResultsFromWaybackAction(WebResourceActionBase):
         return
 
 
+def find_entries(urls: Iterable[str]) -> Dict[str, WebResource]:
+    """Find the archived resource for each of many URLs with a single query.
+
+    :param urls: URLs to look up
+
+    :returns: Resources keyed by href, with their ActionWayback loaded. URLs
+        with no finished Wayback capture are left out.
+    """
+    with get_session() as session:
+        resources = session.scalars(
+            select(WebResource)
+            .join(WebResource.action_wayback)
+            .where(
+                WebResource.href.in_(set(urls)),
+                ActionWayback.wayback_url.startswith("http"),
+            )
+            .options(contains_eager(WebResource.action_wayback))
+            .order_by(WebResource.id)
+        ).unique()
+        # Keep the first resource saved when a URL came from more than one source
+        found: Dict[str, WebResource] = {}
+        for resource in resources:
+            found.setdefault(resource.href, resource)
+        return found
+
+
 def find_entry(url: str) -> WebResource:
     with get_session() as session:
         resource: WebResource = (
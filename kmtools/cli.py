@@ -17,7 +17,9 @@ import psutil
 from pydantic import ValidationError
 
 from kmtools.command import (
+    bulk_import,
     daily,
+    fake_services,
     hourly,
     hypothesis,
     obsidian,
@@ -27,6 +29,8 @@ from kmtools.command import (
     wayback,
 )
 from kmtools.util.config import Config, init_config
+from kmtools.util.http_cache import log_cache_stats
+from kmtools.util.http_session import close_http_sessions
 from kmtools.util.logging_util import PackagePathFilter
 
 logger = logging.getLogger()
@@ -194,6 +198,8 @@ def cli(
     )
 
     ctx.obj = config
+    ctx.call_on_close(log_cache_stats)
+    ctx.call_on_close(close_http_sessions)
 
     find_and_kill_old_instances()
 
@@ -208,6 +214,8 @@ cli.add_command(daily.daily)
 cli.add_command(robustify.robustify)
 cli.add_command(summarize.summarize_command)
 cli.add_command(obsidian.obsidian)
+cli.add_command(bulk_import.import_group)
+cli.add_command(fake_services.fake_services)
 
 
 # pylint: disable=no-value-for-parameter
@@ -0,0 +1,90 @@
+"""Bulk import of exported bookmarks and annotations."""
+
+import time
+from pathlib import Path
+
+import click
+
+from kmtools.action.kagi_action import SummarizeWithKagiAction
+from kmtools.action.mastodon_action import PostToMastodonAction
+from kmtools.action.obsidian_annotate_action import AnnotateObsidianPage
+from kmtools.action.obsidian_daily_action import AddToObsidianDaily
+from kmtools.action.obsidian_hourly_action import SaveToObsidian
+from kmtools.action.summarize_action import SummarizeAction
+from kmtools.action.wayback_action import ResultsFromWaybackAction, SaveToWaybackAction
+from kmtools.source import bulk_import
+
+RESOURCE_ACTIONS = [
+    action.action_name
+    for action in (
+        ResultsFromWaybackAction,
+        SummarizeWithKagiAction,
+        SaveToWaybackAction,
+        SummarizeAction,
+        PostToMastodonAction,
+        SaveToObsidian,
+        AddToObsidianDaily,
+    )
+]
+ANNOTATION_ACTIONS = [AnnotateObsidianPage.action_name]
+
+mark_done_option = click.option(
+    "--mark-done",
+    multiple=True,
+    type=click.Choice(RESOURCE_ACTIONS + ANNOTATION_ACTIONS),
+    help="Record this action as already done for imported items (repeatable).",
+)
+export_file_argument = click.argument(
+    "export_file", type=click.Path(exists=True, dir_okay=False, path_type=Path)
+)
+
+
+def _report(kind: str, counts: bulk_import.ImportCounts, started: float) -> None:
+    elapsed = time.monotonic() - started
+    total = counts.created + counts.updated
+    rate = total / elapsed * 60 if elapsed else total
+    click.echo(
+        f"{total} {kind} imported ({counts.created} new, {counts.updated} updated, "
+        f"{counts.skipped} skipped) in {elapsed:.1f}s ({rate:,.0f} per minute)"
+    )
+
+
+@click.group(name="import")
+def import_group():
+    """Bulk import exported bookmarks and annotations"""
+
+
+@import_group.command(name="pinboard")
+@mark_done_option
+@export_file_argument
+def import_pinboard_command(mark_done, export_file):
+    """Import a Pinboard JSON export
+
+    EXPORT_FILE is the JSON file from Pinboard's export page.
+    """
+    started = time.monotonic()
+    counts = bulk_import.import_pinboard(
+        export_file,
+        mark_done=[action for action in mark_done if action in RESOURCE_ACTIONS],
+    )
+    _report("bookmarks", counts, started)
+
+
+@import_group.command(name="hypothesis")
+@mark_done_option
+@export_file_argument
+def import_hypothesis_command(mark_done, export_file):
+    """Import a Hypothesis annotation dump
+
+    EXPORT_FILE is a JSON export from the Hypothesis client, a saved API
+    search response, or an array of annotations.
+    """
+    started = time.monotonic()
+    counts = bulk_import.import_hypothesis(
+        export_file,
+        mark_done=[action for action in mark_done if action in RESOURCE_ACTIONS],
+        mark_annotations_done=[
+            action for action in mark_done if action in ANNOTATION_ACTIONS
+        ],
+    )
+    _report("annotations", counts, started)
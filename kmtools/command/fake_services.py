@@ -0,0 +1,164 @@
+"""Run local stand-ins for the external services."""
+
+import time
+from typing import Dict
+
+import click
+
+from kmtools.util.fake_services import SERVICES, FakeServices, ServiceBehavior
+
+BEHAVIOR_FIELDS = ("latency", "error_rate", "rate_limit", "burst")
+
+
+def _parse_overrides(overrides) -> Dict[str, Dict[str, str]]:
+    parsed: Dict[str, Dict[str, str]] = {}
+    for override in overrides:
+        target, _, value = override.partition("=")
+        service, _, name = target.partition(".")
+        name = name.replace("-", "_")
+        if service not in SERVICES or name not in BEHAVIOR_FIELDS or not value:
+            raise click.BadParameter(
+                f"{override!r}; expected SERVICE.SETTING=VALUE with SERVICE one of "
+                f"{', '.join(SERVICES)} and SETTING one of {', '.join(BEHAVIOR_FIELDS)}",
+                param_hint="--set",
+            )
+        parsed.setdefault(service, {})[name] = value
+    return parsed
+
+
+@click.command(name="fake-services")
+@click.option("--host", default="127.0.0.1", show_default=True)
+@click.option("--port", default=8765, show_default=True, type=int)
+@click.option(
+    "--items",
+    default=1000,
+    show_default=True,
+    help="Number of bookmarks and annotations to serve.",
+)
+@click.option(
+    "--latency",
+    default="fixed:0",
+    show_default=True,
+    help="Latency for every service: fixed:S, uniform:LOW,HIGH or lognormal:MU,SIGMA.",
+)
+@click.option(
+    "--error-rate",
+    default=0.0,
+    show_default=True,
+    help="Fraction of requests answered with a 5xx error.",
+)
+@click.option(
+    "--rate-limit",
+    type=float,
+    default=None,
+    help="Requests per second per service before answering 429.",
+)
+@click.option(
+    "--capture-delay",
+    default=0.0,
+    show_default=True,
+    help="Seconds before a Save Page Now job succeeds.",
+)
+@click.option(
+    "--capture-slots",
+    default=5,
+    show_default=True,
+    help="Save Page Now captures allowed to run at once.",
+)
+@click.option(
+    "--daily-captures",
+    default=100000,
+    show_default=True,
+    help="Save Page Now captures allowed while the harness runs.",
+)
+@click.option(
+    "--kagi-fetch-delay",
+    default=0.0,
+    show_default=True,
+    help="Seconds Kagi takes to fetch a URL it is asked to summarize.",
+)
+@click.option(
+    "--kagi-blocked-rate",
+    default=0.0,
+    show_default=True,
+    help="Fraction of URLs Kagi can't fetch, as if paywalled or bot-blocked.",
+)
+@click.option("--seed", default=0, show_default=True, help="Seed for generated data.")
+@click.option(
+    "--set",
+    "overrides",
+    multiple=True,
+    metavar="SERVICE.SETTING=VALUE",
+    help="Per-service behavior, e.g. kagi.latency=lognormal:0,0.5 (repeatable).",
+)
+def fake_services(
+    host,
+    port,
+    items,
+    latency,
+    error_rate,
+    rate_limit,
+    capture_delay,
+    capture_slots,
+    daily_captures,
+    kagi_fetch_delay,
+    kagi_blocked_rate,
+    seed,
+    overrides,
+):
+    """Serve fake Pinboard, Hypothesis, Kagi, Wayback and Mastodon APIs
+
+    Prints the environment variables that point kmtools at the fake services,
+    then serves until interrupted and reports per-service request counts.
+    """
+    defaults = {
+        "latency": latency,
+        "error_rate": error_rate,
+        "rate_limit": rate_limit,
+        "burst": None,
+    }
+    per_service = _parse_overrides(overrides)
+    behaviors = {}
+    try:
+        for service in SERVICES:
+            settings = {**defaults, **per_service.get(service, {})}
+            behaviors[service] = ServiceBehavior(
+                latency=settings["latency"],
+                error_rate=float(settings["error_rate"]),
+                rate_limit=(
+                    float(settings["rate_limit"]) if settings["rate_limit"] else None
+                ),
+                burst=int(settings["burst"]) if settings["burst"] else None,
+            )
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint="--set") from e
+
+    fake = FakeServices(
+        host=host,
+        port=port,
+        items=items,
+        behaviors=behaviors,
+        capture_delay=capture_delay,
+        capture_slots=capture_slots,
+        daily_captures=daily_captures,
+        kagi_fetch_delay=kagi_fetch_delay,
+        kagi_blocked_rate=kagi_blocked_rate,
+        seed=seed,
+    )
+    with fake:
+        for service, base_url in fake.base_urls.items():
+            click.echo(f"export KMTOOLS_{service.upper()}__API_BASE_URL={base_url}")
+        click.echo(f"# Serving on {fake.url}; press Ctrl-C to stop", err=True)
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
+
+    click.echo(f"{'Service':<12}{'Requests':>10}{'Errors':>10}{'429s':>10}", err=True)
+    for service, stats in fake.stats.items():
+        click.echo(
+            f"{service:<12}{stats.requests:>10}{stats.errors:>10}"
+            f"{stats.rate_limited:>10}",
+            err=True,
+        )
@@ -8,7 +8,9 @@ from kmtools.action.obsidian_annotate_action import AnnotateObsidianPage
 from kmtools.action.obsidian_hourly_action import SaveToObsidian
 from kmtools.action.summarize_action import SummarizeAction
 from kmtools.action.wayback_action import ResultsFromWaybackAction, SaveToWaybackAction
-from kmtools.source import hypothesis, pinboard
+from kmtools.source.fetch_stage import fetch_all
+from kmtools.source.hypothesis import HypothesisSource
+from kmtools.source.pinboard import PinboardSource
 
 
 @click.command()
@@ -16,8 +18,7 @@ from kmtools.source import hypothesis, pinboard
 def hourly(details):
     """Perform the hourly gathering from origins and action activations"""
 
-    pinboard.fetch(details)
-    hypothesis.fetch(details)
+    fetch_all([PinboardSource(details), HypothesisSource(details)])
 
     actions = [
         ResultsFromWaybackAction(),
@@ -1,7 +1,12 @@
 """Output links that have been robustified."""
 
+import html
 import logging
+import re
+import sys
+from pathlib import Path
 from string import Template
+from typing import Dict, List, Optional, Set, Tuple
 
 import click
 
@@ -11,6 +16,111 @@ from kmtools.models import WebResource
 
 logger = logging.getLogger(__name__)
 
+ROBUST_TEMPLATES = {
+    "html": Template(
+        '<a href="$href" data-versionurl="$archive_url" '
+        'data-versiondate="$archive_date" title="$title | $publisher">$anchor</a>'
+    ),
+    "tt": Template("""
+{{ thursday_threads_quote(href="$href",
+ blockquote='',
+ versiondate="$archive_date",
+ versionurl="$archive_url",
+ anchor="$title",
+ post=", $publisher") }}
+"""),
+    "jekyll": Template(
+        '{{ robustlink(href="$href", versionurl="$archive_url", versiondate="$archive_date", title="$title | $publisher", anchor="$anchor") }}'
+    ),
+}
+
+# Links in a document, matched in one pass so no link is rewritten twice:
+# Markdown inline links (whose URLs may hold balanced parentheses, as
+# Wikipedia's do), HTML anchors and autolinks.
+LINK_PATTERN = re.compile(
+    r"""(?<!!)\[(?P<md_anchor>[^\]]*)\]
+        \(\s*(?:<(?P<md_bracketed>https?://[^<>\n]+)>
+            |(?P<md_href>https?://(?:[^\s()<>]|\([^\s()<>]*\))+))
+        (?:\s+"[^"]*")?\s*\)
+    |<a(?P<a_attributes>(?:\s+[^\s=>]+(?:\s*=\s*(?:"[^"]*"|'[^']*'|[^\s"'>]+))?)*)\s*>
+        (?P<a_anchor>.*?)</a>
+    |<(?P<autolink>https?://[^\s>]+)>""",
+    re.X | re.I | re.S,
+)
+HTML_ATTRIBUTE = re.compile(
+    r"""\s+(?P<name>[^\s=>]+)(?:\s*=\s*(?:"(?P<double>[^"]*)"|'(?P<single>[^']*)'|(?P<bare>[^\s"'>]+)))?"""
+)
+
+
+def _link(match: re.Match) -> Optional[Tuple[str, str]]:
+    """Return the href and anchor of a link, or None if it should be left alone.
+
+    The href has its character references decoded, and the anchor is HTML.
+    Anchors that already carry a version URL, or don't point at the web, are
+    left alone.
+    """
+    if match["md_anchor"] is not None:
+        href = match["md_href"] or match["md_bracketed"]
+        return html.unescape(href), html.escape(match["md_anchor"])
+    if match["a_anchor"] is not None:
+        attributes = {
+            attribute["name"].lower(): attribute["double"]
+            or attribute["single"]
+            or attribute["bare"]
+            or ""
+            for attribute in HTML_ATTRIBUTE.finditer(match["a_attributes"])
+        }
+        href = attributes.get("href", "")
+        if "data-versionurl" in attributes or not re.match(r"https?://", href, re.I):
+            return None
+        return html.unescape(href), match["a_anchor"]
+    return html.unescape(match["autolink"]), ""
+
+
+def _robust_link(style: str, webpage: WebResource, anchor: str) -> str:
+    """Fill a template; `anchor` is HTML, and every other value is escaped."""
+    values = {
+        "href": webpage.href,
+        "archive_url": webpage.action_wayback.wayback_url,
+        "archive_date": webpage.action_wayback.processed_at,
+        "title": webpage.headline,
+        "publisher": webpage.publisher,
+    }
+    return ROBUST_TEMPLATES[style].substitute(
+        {name: html.escape(str(value)) for name, value in values.items()},
+        anchor=anchor,
+    )
+
+
+def robustify_document(text: str, style: str) -> tuple[str, List[str]]:
+    """Replace every archived link in a Markdown or HTML document.
+
+    All links are looked up in one query.
+
+    :param text: The document
+    :param style: One of the ROBUST_TEMPLATES styles
+
+    :returns: The rewritten document, and the links that couldn't be
+        resolved, in document order
+    """
+    links = [_link(match) for match in LINK_PATTERN.finditer(text)]
+    hrefs_in_order = [link[0] for link in links if link]
+    hrefs = set(hrefs_in_order)
+    archived: Dict[str, WebResource] = wayback_action.find_entries(hrefs)
+    unresolved: Set[str] = hrefs - archived.keys()
+
+    def replace(match: re.Match) -> str:
+        link = _link(match)
+        webpage = archived.get(link[0]) if link else None
+        if not webpage:
+            return match[0]
+        href, anchor = link
+        return _robust_link(style, webpage, anchor or html.escape(href))
+
+    text = LINK_PATTERN.sub(replace, text)
+    ordered = [href for href in dict.fromkeys(hrefs_in_order) if href in unresolved]
+    return text, ordered
+
 
 @click.command()
 @click.option(
@@ -32,10 +142,24 @@ logger = logging.getLogger(__name__)
     flag_value="tt",
     help="Output in Jekyll 'include thursday-threads' format",
 )
-@click.argument("url")
+@click.option(
+    "-f",
+    "--file",
+    "document",
+    type=click.Path(dir_okay=False, allow_dash=True, path_type=Path),
+    help="Robustify every link in this Markdown or HTML file, rewriting it in "
+    "place; '-' reads standard input and writes standard output.",
+)
+@click.argument("url", required=False)
 @click.pass_obj
-def robustify(details, style, url):
+def robustify(details, style, document, url):
     """Output markup for a robust link"""
+    if document:
+        _robustify_file(details, style, document)
+        return
+    if not url:
+        raise click.UsageError("Give a URL or a --file to robustify.")
+
     logger.debug(f"Searching for {url}")
 
     try:
@@ -49,35 +173,26 @@ def robustify(details, style, url):
 
     # archive_date = webpage.saved_timestamp.isoformat()
 
-    if style == "html":
-        robust_template = Template(
-            '<a href="$href" data-versionurl="$archive_url" '
-            'data-versiondate="$archive_date" title="$title | $publisher">REPLACE_ME</a>'
-        )
-    elif style == "tt":
-        robust_template = Template(
-            """
-{{ thursday_threads_quote(href="$href",
- blockquote='',
- versiondate="$archive_date",
- versionurl="$archive_url",
- anchor="$title",
- post=", $publisher") }}
-"""
-        )
+    anchor = "REPLACE_ME" if style == "html" else ""
+    print(_robust_link(style, webpage, anchor))
+
+
+def _robustify_file(details, style: str, document: Path) -> None:
+    if str(document) == "-":
+        text = sys.stdin.read()
     else:
-        robust_template = Template(
-            '{{ robustlink(href="$href", versionurl="$archive_url", versiondate="$archive_date", title="$title | $publisher", anchor="") }}'
-        )
-
-    robust_string = robust_template.substitute(
-        {
-            "href": webpage.href,
-            "archive_url": webpage.action_wayback.wayback_url,
-            "archive_date": webpage.action_wayback.processed_at,
-            "title": webpage.headline,
-            "publisher": webpage.publisher,
-        }
-    )
+        text = document.read_text(encoding="utf-8")
+
+    robust_text, unresolved = robustify_document(text, style)
+
+    if str(document) == "-":
+        sys.stdout.write(robust_text)
+    elif details.dry_run:
+        logger.info("Would have rewritten %s", document)
+    elif robust_text != text:
+        document.write_text(robust_text, encoding="utf-8")
 
-    print(robust_string)
+    for href in unresolved:
+        click.echo(f"Not archived: {href}", err=True)
+    if unresolved:
+        click.echo(f"{len(unresolved)} links could not be robustified.", err=True)
@@ -1,16 +1,23 @@
 """_Wayback commands_"""
 
+import json
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import List
+from typing import Any, Dict, List
 
 import click
-from sqlalchemy import select
+from sqlalchemy import delete, select, update
 from sqlalchemy.orm import Session
 
-from kmtools.action.wayback_action import ResultsFromWaybackAction
-from kmtools.models import ProcessStatus, ProcessStatusEnum, WebResource
+from kmtools.action.wayback_action import (
+    ResultsFromWaybackAction,
+    SaveToWaybackAction,
+    latest_capture,
+)
+from kmtools.models import ActionWayback, ProcessStatus, ProcessStatusEnum, WebResource
 from kmtools.util import database
+from kmtools.util.config import get_config
 
 logger = logging.getLogger(__name__)
 
@@ -42,9 +49,162 @@ def _mark_completed(session: Session, resource: WebResource) -> None:
     proc_status.retries = -2
 
 
+def _bulk_triage(session: Session, unresolved: str) -> List[Dict[str, Any]]:
+    """Resolve hung jobs from existing captures; reset or mark the rest.
+
+    :returns: One report entry per hung resource
+    """
+    config = get_config()
+    stmt = (
+        select(WebResource, ActionWayback.id)
+        .join(ProcessStatus, WebResource.id == ProcessStatus.resource_id)
+        .outerjoin(ActionWayback, WebResource.id == ActionWayback.resource_id)
+        .where(
+            ProcessStatus.status == ProcessStatusEnum.RETRIES_EXCEEDED,
+            ProcessStatus.action_name == ResultsFromWaybackAction.action_name,
+        )
+    )
+    hung = session.execute(stmt).all()
+
+    with ThreadPoolExecutor(max_workers=config.wayback.precheck_workers) as executor:
+        # Look up the same URL that SaveToWaybackAction submitted
+        captures = list(executor.map(latest_capture, [row[0].url for row in hung]))
+
+    report = []
+    resolved: List[Dict[str, Any]] = []
+    for (resource, action_id), capture in zip(hung, captures):
+        entry = {
+            "resource_id": resource.id,
+            "origin": resource.discriminator,
+            "url": resource.url,
+        }
+        if capture and action_id:
+            timestamp, original_url = capture
+            entry["result"] = "resolved"
+            entry["wayback_url"] = f"https://web.archive.org/{timestamp}/{original_url}"
+            resolved.append(
+                {
+                    "id": action_id,
+                    "wayback_url": entry["wayback_url"],
+                    "wayback_timestamp": timestamp,
+                    "wayback_details": json.dumps(
+                        {
+                            "source": "cdx",
+                            "timestamp": timestamp,
+                            "original_url": original_url,
+                        }
+                    ),
+                }
+            )
+        else:
+            entry["result"] = unresolved
+            entry["wayback_url"] = None
+        report.append(entry)
+
+    if config.dry_run:
+        return report
+
+    resolved_ids = [
+        entry["resource_id"] for entry in report if entry["result"] == "resolved"
+    ]
+    if resolved:
+        session.execute(update(ActionWayback), resolved)
+        session.execute(
+            update(ProcessStatus)
+            .where(
+                ProcessStatus.resource_id.in_(resolved_ids),
+                ProcessStatus.action_name == ResultsFromWaybackAction.action_name,
+            )
+            .values(status=ProcessStatusEnum.COMPLETED, retries=-2)
+        )
+
+    unresolved_ids = [
+        entry["resource_id"] for entry in report if entry["result"] == unresolved
+    ]
+    if unresolved_ids and unresolved == "marked":
+        session.execute(
+            update(ProcessStatus)
+            .where(
+                ProcessStatus.resource_id.in_(unresolved_ids),
+                ProcessStatus.action_name == ResultsFromWaybackAction.action_name,
+            )
+            .values(status=ProcessStatusEnum.COMPLETED, retries=-2)
+        )
+    elif unresolved_ids and unresolved == "reset":
+        # Forget the hung job so the next run submits the URL again
+        session.execute(
+            delete(ActionWayback).where(ActionWayback.resource_id.in_(unresolved_ids))
+        )
+        session.execute(
+            delete(ProcessStatus).where(
+                ProcessStatus.resource_id.in_(unresolved_ids),
+                ProcessStatus.action_name.in_(
+                    [
+                        SaveToWaybackAction.action_name,
+                        ResultsFromWaybackAction.action_name,
+                    ]
+                ),
+            )
+        )
+    session.commit()
+    return report
+
+
+def _echo_report(report: List[Dict[str, Any]]) -> None:
+    fmt_str = "{:>10.10s}  {:13.13s}  {:10.10s}  {:s}"
+    click.echo(fmt_str.format("Resource", "Origin", "Result", "URL"))
+    for entry in report:
+        click.echo(
+            fmt_str.format(
+                str(entry["resource_id"]),
+                entry["origin"],
+                entry["result"],
+                entry["wayback_url"] or entry["url"],
+            )
+        )
+    click.echo()
+    for result in sorted({entry["result"] for entry in report}):
+        count = sum(1 for entry in report if entry["result"] == result)
+        click.echo(f"{result:>10s}: {count}")
+    click.echo(f"{'total':>10s}: {len(report)}")
+
+
 @wayback.command(name="hung")
-def hung_jobs():
+@click.option(
+    "--bulk",
+    is_flag=True,
+    help="Resolve all hung jobs from their latest Wayback captures, without prompting.",
+)
+@click.option(
+    "--unresolved",
+    type=click.Choice(["left", "reset", "marked"]),
+    default="left",
+    show_default=True,
+    help="With --bulk, what to do with jobs that have no capture: leave them, "
+    "reset them so the URL is submitted again, or mark them complete.",
+)
+@click.option(
+    "--json", "as_json", is_flag=True, help="With --bulk, print a JSON report."
+)
+@click.pass_context
+def hung_jobs(ctx, bulk, unresolved, as_json):
     """List hung Wayback jobs"""
+    unresolved_given = (
+        ctx.get_parameter_source("unresolved") is not click.core.ParameterSource.DEFAULT
+    )
+    if not bulk and (unresolved_given or as_json):
+        raise click.UsageError("--unresolved and --json require --bulk.", ctx=ctx)
+    if bulk:
+        with database.get_session() as session:
+            report = _bulk_triage(session, unresolved)
+        if as_json:
+            click.echo(json.dumps(report, indent=2))
+        elif report:
+            _echo_report(report)
+        else:
+            click.echo(click.style("No hung jobs found.", fg="green"))
+        return
+
     with database.get_session() as session:
         stmt = (
             select(WebResource)
@@ -58,9 +218,9 @@ def hung_jobs():
 
         if stalled_rows:
             fmt_str = "{:10.10s} {:13.13s}  {:31.31s}  {:s}"
+            click.echo(fmt_str.format("Resource", "Origin", "Saved", "URL"))
+            click.echo("Wayback URL\n")
             for row in stalled_rows:
-                click.echo(fmt_str.format("Resource", "Origin", "Saved", "URL"))
-                click.echo("Wayback URL\n")
                 click.echo(
                     fmt_str.format(
                         str(row.id),
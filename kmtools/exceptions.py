@@ -160,6 +160,38 @@ class SummarizeError(KMException):
         super().__init__(message)
 
 
+class DocumentRejectedError(KMException):
+    """Exception raised when a download is abandoned because it can't be summarized."""
+
+    default_detail = "Document can't be summarized"
+
+    def __init__(self, message):
+        self.detail = message
+        super().__init__(message)
+
+
+class UnsupportedDocumentError(DocumentRejectedError):
+    """Exception raised when a document is media or another type without text."""
+
+    default_detail = "Unsupported document type"
+
+
+class DocumentTooLargeError(DocumentRejectedError):
+    """Exception raised when a document is larger than the download limit."""
+
+    default_detail = "Document too large"
+
+
+class TaskLimitError(KMException):
+    """Exception raised when a worker task exceeds its CPU time or memory limit."""
+
+    default_detail = "Task exceeded its resource limits"
+
+    def __init__(self, message):
+        self.detail = message
+        super().__init__(message)
+
+
 class ActionError(KMException):
     """Exception raised for Actions.
 
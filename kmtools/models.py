@@ -7,14 +7,15 @@ import re
 from dataclasses import dataclass
 from datetime import datetime
 from functools import cached_property
-from typing import List, Optional, Tuple
+from typing import Dict, List, Optional, Tuple
 
-import requests
 from bs4 import BeautifulSoup, Tag
 from sqlalchemy import (
     DateTime,
+    Float,
     ForeignKey,
     Integer,
+    LargeBinary,
     String,
     UniqueConstraint,
     func,
@@ -25,6 +26,7 @@ from sqlalchemy.ext.declarative import declared_attr
 from sqlalchemy.orm import Mapped, Session, mapped_column, relationship
 
 from kmtools.util.database import Base
+from kmtools.util.http_cache import cached_get
 
 logger = logging.getLogger(__name__)
 
@@ -306,7 +308,7 @@ class HypothesisPage(WebResource):
         return self._url_normalization.annotation_url
 
     def transcript_urls(self) -> Tuple[str, str, str, str]:
-        page = requests.get(self.href, timeout=10)
+        page = cached_get(self.href, timeout=10)
         page.raise_for_status()
         soup = BeautifulSoup(page.content, "html.parser")
         episode_id = soup.find("a", id="episode")
@@ -390,6 +392,7 @@ class HypothesisAnnotation(Base):
         document_url: str,
         document_title: str,
         saved_timestamp: datetime,
+        page_cache: Optional[Dict[str, HypothesisPage]] = None,
     ) -> Tuple["HypothesisAnnotation", HypothesisPage]:
         """
         Creates a new HypothesisAnnotation and ensures the associated HypothesisPage exists.
@@ -404,6 +407,9 @@ class HypothesisAnnotation(Base):
         - document_url (str): The URI to associate with the HypothesisPage and HypothesisAnnotation.
         - document_title (str): The title of the document
         - saved_timestamp (datetime): Timestamp of when the annotation was created
+        - page_cache (dict, optional): HypothesisPage objects already seen in this
+          run, keyed by URI. Consulted before querying the database and updated
+          with any page that is found or created.
 
         Returns:
         - Tuple[HypothesisAnnotation, HypothesisPage]: A tuple containing the newly
@@ -417,8 +423,12 @@ class HypothesisAnnotation(Base):
             print(f"Annotation added to page with URI: {page.uri}")
         """
         # Ensure the HypothesisPage exists
-        stmt = select(HypothesisPage).where(HypothesisPage.href == document_url)
-        page: Optional[HypothesisPage] = session.execute(stmt).scalars().first()
+        page: Optional[HypothesisPage] = None
+        if page_cache is not None:
+            page = page_cache.get(document_url)
+        if not page:
+            stmt = select(HypothesisPage).where(HypothesisPage.href == document_url)
+            page = session.execute(stmt).scalars().first()
 
         if not page:
             page = HypothesisPage(
@@ -428,6 +438,9 @@ class HypothesisAnnotation(Base):
             )
             session.add(page)
 
+        if page_cache is not None:
+            page_cache[document_url] = page
+
         # Create the HypothesisAnnotation
         annotation = cls()
         page.annotations.append(annotation)
@@ -498,6 +511,8 @@ class ActionSummary(Base):
     )
     summary: Mapped[Optional[str]] = mapped_column(String, nullable=True)
     derived_date: Mapped[Optional[str]] = mapped_column(String, nullable=True)
+    content_hash: Mapped[Optional[str]] = mapped_column(String, nullable=True)
+    summarizer_version: Mapped[Optional[str]] = mapped_column(String, nullable=True)
     resource: Mapped[WebResource] = relationship(
         "WebResource", back_populates="action_summary", uselist=False
     )
@@ -548,11 +563,45 @@ class ActionKagi(Base):
         nullable=False,  # pylint:disable=not-callable
     )
     kagi_summary: Mapped[Optional[str]] = mapped_column(String, nullable=True)
+    content_hash: Mapped[Optional[str]] = mapped_column(String, nullable=True)
+    summarizer_version: Mapped[Optional[str]] = mapped_column(String, nullable=True)
     resource: Mapped[WebResource] = relationship(
         "WebResource", back_populates="action_kagi", uselist=False
     )
 
 
+class KagiCache(Base):
+    """A Kagi summary, kept so the same document isn't paid for twice."""
+
+    __tablename__ = "kagi_cache"
+    __table_args__ = (UniqueConstraint("url", "engine"),)
+    id: Mapped[int] = mapped_column(primary_key=True)
+    # Normalized with kagi_action.normalize_url()
+    url: Mapped[str] = mapped_column(String)
+    engine: Mapped[str] = mapped_column(String)
+    summary: Mapped[str] = mapped_column(String)
+    # Fingerprint of the text that was summarized, if it was known
+    content_hash: Mapped[Optional[str]] = mapped_column(String, nullable=True)
+    tokens: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    processed_at: Mapped[datetime] = mapped_column(
+        DateTime(),
+        default=func.now(),
+        onupdate=func.now(),
+        nullable=False,  # pylint:disable=not-callable
+    )
+
+
+class KagiUsage(Base):
+    """What Kagi API calls cost in one calendar month (UTC)."""
+
+    __tablename__ = "kagi_usage"
+    # YYYY-MM
+    month: Mapped[str] = mapped_column(String, primary_key=True)
+    calls: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    tokens: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    cost: Mapped[float] = mapped_column(Float, default=0.0, nullable=False)
+
+
 class ActionObsidianHourly(Base):
     __tablename__ = "action_obsidian_hourly"
     __table_args__ = (UniqueConstraint("resource_id"),)
@@ -601,3 +650,67 @@ class ActionObsidianAnnotation(Base):
         back_populates="action_obsidian_annotation",
         uselist=False,
     )
+
+
+class Term(Base):
+    """A word in the corpus-wide document-frequency index."""
+
+    __tablename__ = "term"
+    __table_args__ = (UniqueConstraint("term"),)
+    id: Mapped[int] = mapped_column(primary_key=True)
+    term: Mapped[str] = mapped_column(String)
+    document_count: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+
+
+class IndexedDocument(Base):
+    """The distinct terms of a resource's extracted text, as counted in the index."""
+
+    __tablename__ = "indexed_document"
+    resource_id: Mapped[int] = mapped_column(
+        Integer, ForeignKey("webresource.id"), primary_key=True
+    )
+    # Sorted term IDs packed as unsigned 32-bit integers
+    term_ids: Mapped[bytes] = mapped_column(LargeBinary)
+    processed_at: Mapped[datetime] = mapped_column(
+        DateTime(),
+        default=func.now(),
+        onupdate=func.now(),
+        nullable=False,  # pylint:disable=not-callable
+    )
+
+
+class SyncState(Base):
+    """Bookkeeping for incremental synchronization with an activity source."""
+
+    __tablename__ = "sync_state"
+    __table_args__ = (UniqueConstraint("source_name"),)
+    id: Mapped[int] = mapped_column(primary_key=True)
+    source_name: Mapped[str] = mapped_column(String)
+    cursor: Mapped[Optional[str]] = mapped_column(String, nullable=True)
+    remote_updated: Mapped[Optional[str]] = mapped_column(String, nullable=True)
+    last_success: Mapped[Optional[datetime]] = mapped_column(
+        DateTime(timezone=True), nullable=True
+    )
+    last_error: Mapped[Optional[str]] = mapped_column(String, nullable=True)
+    items_last_run: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    items_total: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    processed_at: Mapped[datetime] = mapped_column(
+        DateTime(),
+        default=func.now(),
+        onupdate=func.now(),
+        nullable=False,  # pylint:disable=not-callable
+    )
+
+    @classmethod
+    def for_source(cls, session: Session, source_name: str) -> "SyncState":
+        """
+        Return the sync state row for a source, creating it if necessary.
+
+        A newly created row is added to the session but not committed.
+        """
+        stmt = select(cls).where(cls.source_name == source_name)
+        state: Optional[SyncState] = session.execute(stmt).scalars().first()
+        if not state:
+            state = cls(source_name=source_name)
+            session.add(state)
+        return state
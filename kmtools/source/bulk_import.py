@@ -0,0 +1,378 @@
+"""Bulk import of Pinboard and Hypothesis export files.
+
+Backfilling years of history through the live APIs is slow and rate-limited,
+so export files are loaded directly instead. The file is parsed as a stream
+and written with executemany inserts and updates through SQLAlchemy Core, one
+large transaction per batch, bypassing the per-object work of the ORM.
+
+Status rows can be pre-seeded for newly imported items, so actions that make
+no sense for old material (posting to Mastodon, say) treat them as done.
+"""
+
+import json
+import logging
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from itertools import batched
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Sequence
+
+from dateutil.parser import isoparse
+from sqlalchemy import Connection, bindparam, insert, select, update
+
+from kmtools.models import (
+    AnnotationStatus,
+    HypothesisAnnotation,
+    HypothesisPage,
+    Pinboard,
+    ProcessStatus,
+    ProcessStatusEnum,
+    VisibilityEnum,
+    WebResource,
+)
+from kmtools.util.database import get_engine
+from kmtools.util.json_stream import iter_json_array
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 10000
+CHUNK_SIZE = 1024 * 1024
+
+# Marks status rows written by an import rather than by running the action
+IMPORTED_RETRIES = -1
+
+_webresource = WebResource.__table__
+_pinboard = Pinboard.__table__
+_hypothesis_page = HypothesisPage.__table__
+_hypothesis_annotation = HypothesisAnnotation.__table__
+
+
+@dataclass
+class ImportCounts:
+    """Tally of what an import did."""
+
+    created: int = 0
+    updated: int = 0
+    skipped: int = 0
+
+
+def _read_items(path: Path, keys: Sequence[str] = ()) -> Iterator[Any]:
+    with path.open("rb") as export_file:
+        yield from iter_json_array(
+            iter(lambda: export_file.read(CHUNK_SIZE), b""), keys=keys
+        )
+
+
+def _existing_ids(
+    connection: Connection, discriminator: str, hrefs: Iterable[str]
+) -> Dict[str, int]:
+    stmt = select(_webresource.c.href, _webresource.c.id).where(
+        _webresource.c.discriminator == discriminator,
+        _webresource.c.href.in_(set(hrefs)),
+    )
+    return dict(connection.execute(stmt).all())
+
+
+def _insert_resources(
+    connection: Connection, rows: List[Dict[str, Any]]
+) -> Dict[str, int]:
+    """Insert webresource rows and return their new ids keyed by href."""
+    if not rows:
+        return {}
+    stmt = insert(_webresource).returning(
+        _webresource.c.href, _webresource.c.id, sort_by_parameter_order=True
+    )
+    return dict(connection.execute(stmt, rows).all())
+
+
+def _seed_status(
+    connection: Connection,
+    table,
+    id_column: str,
+    ids: Iterable[int],
+    action_names: Sequence[str],
+    now: datetime,
+) -> None:
+    rows = [
+        {
+            id_column: item_id,
+            "action_name": action_name,
+            "status": ProcessStatusEnum.COMPLETED,
+            "processed_at": now,
+            "retries": IMPORTED_RETRIES,
+        }
+        for item_id in ids
+        for action_name in action_names
+    ]
+    if rows:
+        connection.execute(insert(table), rows)
+
+
+def _pinboard_values(bookmark: Dict[str, Any]) -> Dict[str, Any]:
+    """Column values for a bookmark, mapped the same way as the live source."""
+    return {
+        "hash": bookmark["hash"],
+        "meta": bookmark.get("meta"),
+        "toread": bookmark["toread"],
+        "tags": json.dumps(
+            [tag.replace("-", " ") for tag in bookmark["tags"].split(" ")]
+        ),
+        "shared": (
+            VisibilityEnum.PUBLIC if bookmark["shared"] else VisibilityEnum.PRIVATE
+        ),
+    }
+
+
+def import_pinboard(
+    path: Path, mark_done: Sequence[str] = (), batch_size: int = BATCH_SIZE
+) -> ImportCounts:
+    """Load a Pinboard JSON export (the same shape as `posts/all`).
+
+    Bookmarks already in the database are updated in place; new ones are
+    inserted and get COMPLETED status rows for each action in `mark_done`.
+    """
+    counts = ImportCounts()
+    now = datetime.now(timezone.utc)
+
+    with get_engine().connect() as connection:
+        for batch in batched(_read_items(path), batch_size):
+            # Pinboard has one bookmark per URL; keep the last in case of repeats
+            bookmarks = {bookmark["href"]: bookmark for bookmark in batch}
+            existing = _existing_ids(connection, "pinboard", bookmarks)
+
+            new_resources = [
+                {
+                    "discriminator": "pinboard",
+                    "href": href,
+                    "title": bookmark["description"],
+                    "description": bookmark["extended"],
+                    "saved_timestamp": isoparse(bookmark["time"]),
+                }
+                for href, bookmark in bookmarks.items()
+                if href not in existing
+            ]
+            created = _insert_resources(connection, new_resources)
+            if created:
+                connection.execute(
+                    insert(_pinboard),
+                    [
+                        {"id": resource_id, **_pinboard_values(bookmarks[href])}
+                        for href, resource_id in created.items()
+                    ],
+                )
+                _seed_status(
+                    connection,
+                    ProcessStatus.__table__,
+                    "resource_id",
+                    created.values(),
+                    mark_done,
+                    now,
+                )
+
+            if existing:
+                connection.execute(
+                    update(_webresource).where(
+                        _webresource.c.id == bindparam("resource_id")
+                    ),
+                    [
+                        {
+                            "resource_id": resource_id,
+                            "title": bookmarks[href]["description"],
+                            "description": bookmarks[href]["extended"],
+                            "saved_timestamp": isoparse(bookmarks[href]["time"]),
+                        }
+                        for href, resource_id in existing.items()
+                    ],
+                )
+                connection.execute(
+                    update(_pinboard).where(_pinboard.c.id == bindparam("resource_id")),
+                    [
+                        {
+                            "resource_id": resource_id,
+                            **_pinboard_values(bookmarks[href]),
+                        }
+                        for href, resource_id in existing.items()
+                    ],
+                )
+
+            connection.commit()
+            counts.created += len(created)
+            counts.updated += len(existing)
+            counts.skipped += len(batch) - len(bookmarks)
+            logger.info(
+                "Imported %s bookmarks (%s new)",
+                counts.created + counts.updated,
+                counts.created,
+            )
+
+    return counts
+
+
+def _annotation_values(annotation: Dict[str, Any]) -> Dict[str, Any]:
+    """Column values for an annotation, mapped the same way as the live source."""
+    quote = ""
+    target = annotation["target"][0] if annotation.get("target") else {}
+    for selector in target.get("selector", []):
+        if selector["type"] == "TextQuoteSelector":
+            quote = selector["exact"]
+    return {
+        "hyp_id": annotation["id"],
+        "annotation": annotation["text"],
+        "time_created": isoparse(annotation["created"]),
+        "time_updated": isoparse(annotation["updated"]),
+        "quote": quote,
+        "document_title": _annotation_title(annotation),
+        "link_html": annotation.get("links", {}).get("html"),
+        "link_incontext": annotation.get("links", {}).get("incontext"),
+        "shared": (
+            VisibilityEnum.PRIVATE
+            if annotation.get("hidden")
+            else VisibilityEnum.PUBLIC
+        ),
+        "flagged": int(annotation.get("flagged", False)),
+        "tags": json.dumps(annotation.get("tags", [])),
+    }
+
+
+def _annotation_title(annotation: Dict[str, Any]) -> str:
+    if annotation.get("document", {}).get("title"):
+        return annotation["document"]["title"][0]
+    return annotation["uri"].rsplit("/", 1)[-1].rsplit(".", 1)[0]
+
+
+def import_hypothesis(
+    path: Path,
+    mark_done: Sequence[str] = (),
+    mark_annotations_done: Sequence[str] = (),
+    batch_size: int = BATCH_SIZE,
+) -> ImportCounts:
+    """Load a Hypothesis annotation dump.
+
+    Accepts the JSON export of the Hypothesis client (annotations under an
+    "annotations" key), a saved `/api/search` response ("rows") or a plain
+    array of annotations. Replies to other annotations are skipped, as in the
+    live source.
+
+    Annotations already in the database (matched on their Hypothesis id) are
+    updated in place. New pages get COMPLETED status rows for `mark_done`;
+    new annotations get them for `mark_annotations_done`.
+    """
+    counts = ImportCounts()
+    now = datetime.now(timezone.utc)
+
+    with get_engine().connect() as connection:
+        items = _read_items(path, keys=("annotations", "rows"))
+        for batch in batched(items, batch_size):
+            annotations = {}
+            for annotation in batch:
+                if "references" in annotation:
+                    counts.skipped += 1
+                    continue
+                annotations[annotation["id"]] = annotation
+
+            stmt = select(
+                _hypothesis_annotation.c.hyp_id, _hypothesis_annotation.c.id
+            ).where(_hypothesis_annotation.c.hyp_id.in_(annotations))
+            existing = dict(connection.execute(stmt).all())
+
+            # Pages are public as soon as one annotation on them is
+            pages: Dict[str, Dict[str, Any]] = {}
+            for annotation in annotations.values():
+                page = pages.setdefault(
+                    annotation["uri"],
+                    {
+                        "discriminator": "hypothesis",
+                        "href": annotation["uri"],
+                        "title": _annotation_title(annotation),
+                        "saved_timestamp": isoparse(annotation["created"]),
+                        "shared": VisibilityEnum.PRIVATE,
+                    },
+                )
+                if not annotation.get("hidden"):
+                    page["shared"] = VisibilityEnum.PUBLIC
+
+            page_ids = _existing_ids(connection, "hypothesis", pages)
+            created_pages = _insert_resources(
+                connection,
+                [
+                    {key: value for key, value in page.items() if key != "shared"}
+                    for href, page in pages.items()
+                    if href not in page_ids
+                ],
+            )
+            if created_pages:
+                connection.execute(
+                    insert(_hypothesis_page),
+                    [
+                        {"id": page_id, "shared": pages[href]["shared"]}
+                        for href, page_id in created_pages.items()
+                    ],
+                )
+                _seed_status(
+                    connection,
+                    ProcessStatus.__table__,
+                    "resource_id",
+                    created_pages.values(),
+                    mark_done,
+                    now,
+                )
+            public_pages = [
+                page_id
+                for href, page_id in page_ids.items()
+                if pages[href]["shared"] == VisibilityEnum.PUBLIC
+            ]
+            if public_pages:
+                connection.execute(
+                    update(_hypothesis_page)
+                    .where(_hypothesis_page.c.id.in_(public_pages))
+                    .values(shared=VisibilityEnum.PUBLIC)
+                )
+            page_ids.update(created_pages)
+
+            new_annotations = [
+                {
+                    "page_id": page_ids[annotation["uri"]],
+                    **_annotation_values(annotation),
+                }
+                for hyp_id, annotation in annotations.items()
+                if hyp_id not in existing
+            ]
+            if new_annotations:
+                created = connection.execute(
+                    insert(_hypothesis_annotation).returning(
+                        _hypothesis_annotation.c.id, sort_by_parameter_order=True
+                    ),
+                    new_annotations,
+                ).scalars()
+                _seed_status(
+                    connection,
+                    AnnotationStatus.__table__,
+                    "annotation_id",
+                    list(created),
+                    mark_annotations_done,
+                    now,
+                )
+            if existing:
+                connection.execute(
+                    update(_hypothesis_annotation).where(
+                        _hypothesis_annotation.c.id == bindparam("annotation_id")
+                    ),
+                    [
+                        {
+                            "annotation_id": annotation_id,
+                            **_annotation_values(annotations[hyp_id]),
+                        }
+                        for hyp_id, annotation_id in existing.items()
+                    ],
+                )
+
+            connection.commit()
+            counts.created += len(new_annotations)
+            counts.updated += len(existing)
+            logger.info(
+                "Imported %s annotations (%s new)",
+                counts.created + counts.updated,
+                counts.created,
+            )
+
+    return counts
@@ -0,0 +1,95 @@
+"""Fetch from all activity sources concurrently."""
+
+import logging
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Dict, List, Optional
+
+from kmtools.util.database import get_engine
+
+from .source_base import SourceBase
+
+logger = logging.getLogger(__name__)
+
+
+def fetch_all(sources: List[SourceBase]) -> Dict[str, Optional[BaseException]]:
+    """Sync every source at the same time.
+
+    Sources talk to different services and write to disjoint tables, so there
+    is no reason for one to wait on another. A source that raises an exception
+    or runs past its timeout is logged and otherwise ignored; the remaining
+    sources are unaffected.
+
+    A source that times out is asked to stop, and it does so before storing
+    its next batch. Its HTTP calls have timeouts of their own, which bounds how
+    long that takes. This function returns only once every source has stopped
+    writing to the database.
+
+    :param sources: The sources to sync
+
+    :returns: Dictionary keyed by source name with None for a successful fetch,
+        otherwise the exception raised (TimeoutError for a timeout)
+    """
+    results: Dict[str, Optional[BaseException]] = {}
+    if not sources:
+        return results
+
+    # Open the database here, so the sources don't race to create the engine
+    get_engine()
+    executor = ThreadPoolExecutor(
+        max_workers=len(sources), thread_name_prefix="source-fetch"
+    )
+    started = time.monotonic()
+    futures: Dict[Future, SourceBase] = {
+        executor.submit(source.run): source for source in sources
+    }
+    deadlines = {
+        future: started + source.fetch_timeout for future, source in futures.items()
+    }
+
+    pending = set(futures)
+    try:
+        while pending:
+            next_deadline = min(deadlines[future] for future in pending)
+            done, pending = wait(
+                pending,
+                timeout=max(0.0, next_deadline - time.monotonic()),
+                return_when=FIRST_COMPLETED,
+            )
+            for future in done:
+                source = futures[future]
+                elapsed = time.monotonic() - started
+                exception = future.exception()
+                if exception:
+                    logger.error(
+                        "Fetching from %s failed after %.1fs: %s",
+                        source.source_name,
+                        elapsed,
+                        exception,
+                        exc_info=exception,
+                    )
+                    results[source.source_name] = exception
+                else:
+                    logger.info("Fetched from %s in %.1fs", source.source_name, elapsed)
+                    results[source.source_name] = None
+
+            now = time.monotonic()
+            for future in [f for f in pending if deadlines[f] <= now]:
+                source = futures[future]
+                logger.error(
+                    "Fetching from %s timed out after %ss",
+                    source.source_name,
+                    source.fetch_timeout,
+                )
+                results[source.source_name] = TimeoutError(
+                    f"{source.source_name} fetch exceeded {source.fetch_timeout}s"
+                )
+                source.stop()
+                pending.discard(future)
+    finally:
+        for source in futures.values():
+            if source.source_name not in results:
+                source.stop()
+        executor.shutdown(wait=True, cancel_futures=True)
+
+    return results
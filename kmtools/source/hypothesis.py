@@ -1,109 +1,151 @@
 import logging
 
-import requests
 from dateutil.parser import isoparse
 from sqlalchemy import desc, select
 
 from kmtools import exceptions
 from kmtools.models import HypothesisAnnotation, VisibilityEnum
-from kmtools.util.database import get_session
+from kmtools.util.http_session import get_http_session
+
+from .source_base import SourceBase
 
 logger = logging.getLogger(__name__)
 
+# Largest page size the Hypothesis search API allows
+PAGE_SIZE = 200
 
-def fetch(config):
-    """Update local Hypothesis database"""
 
-    headers = {
-        "Accept": "application/vnd.hypothesis.v1+json",
-    }
-    params = {
-        "sort": "updated",
-        "order": "asc",
-        "user": config.hypothesis.user,
-    }
-
-    with get_session() as session:
-        # Query the most recent Pinboard entry based on the 'time' column
-        stmt = (
-            select(HypothesisAnnotation)
-            .order_by(desc(HypothesisAnnotation.time_updated))
-            .limit(1)
+def _initial_search_after(session):
+    """Derive a starting cursor from the newest stored annotation.
+
+    Used when there is no checkpointed cursor yet. We're using
+    `microseconds=999999` as a kluge to get past the most recent annotation
+    in the database.
+    """
+    stmt = (
+        select(HypothesisAnnotation)
+        .order_by(desc(HypothesisAnnotation.time_updated))
+        .limit(1)
+    )
+    most_recent_annotation = session.execute(stmt).scalars().first()
+    if not most_recent_annotation or not most_recent_annotation.time_updated:
+        return None
+    since_date = most_recent_annotation.time_updated
+    return since_date.replace(microsecond=999999, tzinfo=None).isoformat() + "Z"
+
+
+def _store_annotation(session, annotation, page_cache):
+    logger.debug(
+        "Got annotation %s, last updated %s",
+        annotation["id"],
+        annotation["updated"],
+    )
+    ## Skip comments on other's annotations
+    if "references" in annotation:
+        logger.debug("Skipping...reference to %s", annotation["references"])
+        return
+
+    quote = ""
+    if "selector" in annotation["target"][0]:
+        for selector in annotation["target"][0]["selector"]:
+            if selector["type"] == "TextQuoteSelector":
+                quote = selector["exact"]
+    if "title" in annotation["document"]:
+        title = annotation["document"]["title"][0]
+    else:
+        title = annotation["uri"].rsplit("/", 1)[-1].rsplit(".", 1)[0]
+
+    with session.no_autoflush:
+        hypothesis_annotation, hypothesis_page = HypothesisAnnotation.create_with_page(
+            session,
+            annotation["uri"],
+            title,
+            isoparse(annotation["created"]),
+            page_cache=page_cache,
+        )
+        hypothesis_annotation.hyp_id = annotation["id"]
+        hypothesis_annotation.annotation = annotation["text"]
+        hypothesis_annotation.time_updated = isoparse(annotation["updated"])
+        hypothesis_annotation.quote = quote
+        hypothesis_annotation.tags = annotation["tags"]
+        hypothesis_annotation.link_html = annotation["links"]["html"]
+        hypothesis_annotation.link_incontext = annotation["links"]["incontext"]
+        hypothesis_annotation.shared = (
+            VisibilityEnum.PRIVATE if annotation["hidden"] else VisibilityEnum.PUBLIC
         )
+        hypothesis_annotation.flagged = int(annotation["flagged"])
 
-        # Execute the query. We're using `microseconds=999999` as a
-        # kluge to get past the most recent annotaion in the database.
-        most_recent_annotation = session.execute(stmt).scalars().first()
-        since_date = most_recent_annotation.time_updated
-        if since_date:
-            params["search_after"] = (
-                since_date.replace(microsecond=999999, tzinfo=None).isoformat() + "Z"
-            )
+        hypothesis_page.shared = (
+            VisibilityEnum.PRIVATE if annotation["hidden"] else VisibilityEnum.PUBLIC
+        )
+
+    # TODO: Is this important?
+    # if "group:__world__" in annotation["permissions"]["read"]:
+    logger.info("Added %s from %s.", annotation["uri"], annotation["updated"])
+
+
+class HypothesisSource(SourceBase):
+    """Annotations made with Hypothesis"""
+
+    source_name = "hypothesis"
+
+    def __init__(self, config) -> None:
+        super().__init__(config)
+        # Consecutive annotations usually belong to the same page, so pages
+        # are cached by URI for the whole run.
+        self.page_cache = {}
+
+    @property
+    def fetch_timeout(self) -> float:
+        return self.config.hypothesis.fetch_timeout
+
+    def fetch_batches(self, session, state):
+        """Page through every annotation updated since the last run.
+
+        Each page of results is one batch, checkpointed with the `updated`
+        value of its last annotation as the `search_after` cursor.
+        """
+        headers = {
+            "Accept": "application/vnd.hypothesis.v1+json",
+        }
+        params = {
+            "sort": "updated",
+            "order": "asc",
+            "limit": PAGE_SIZE,
+            "user": self.config.hypothesis.user,
+        }
+        search_after = state.cursor or _initial_search_after(session)
 
         logger.debug("Calling Hypothesis with %s (plus auth) and %s", headers, params)
         headers["Authorization"] = (
-            f"Bearer {config.hypothesis.api_token.get_secret_value()}"
+            f"Bearer {self.config.hypothesis.api_token.get_secret_value()}"
         )
 
-        r = requests.get(
-            "https://api.hypothes.is/api/search",
-            headers=headers,
-            params=params,
-            timeout=20,
-        )
-        if r.status_code > 200:
-            logger.info("Couldn't call Hypothesis: (%s): %s", r.status_code, r.text)
-            raise exceptions.HypothesisError(r.status_code, r.text)
-
-    for annotation in r.json()["rows"]:
-        logger.debug(
-            "Got annotation %s, last updated %s",
-            annotation["id"],
-            annotation["updated"],
-        )
-        ## Skip comments on other's annotations
-        if "references" in annotation:
-            logger.debug("Skipping...reference to %s", annotation["references"])
-            continue
-
-        if "selector" in annotation["target"][0]:
-            for selector in annotation["target"][0]["selector"]:
-                if selector["type"] == "TextQuoteSelector":
-                    quote = selector["exact"]
-        else:
-            quote = ""
-        if "title" in annotation["document"]:
-            title = annotation["document"]["title"][0]
-        else:
-            title = annotation["uri"].rsplit("/", 1)[-1].rsplit(".", 1)[0]
-
-        with session.no_autoflush:
-            hypothesis_annotation, hypothesis_page = (
-                HypothesisAnnotation.create_with_page(
-                    session, annotation["uri"], title, isoparse(annotation["created"])
-                )
+        while True:
+            if search_after:
+                params["search_after"] = search_after
+            r = get_http_session("hypothesis").get(
+                f"{self.config.hypothesis.api_base_url}/search",
+                headers=headers,
+                params=params,
             )
-            hypothesis_annotation.hyp_id = annotation["id"]
-            hypothesis_annotation.annotation = annotation["text"]
-            hypothesis_annotation.time_updated = isoparse(annotation["updated"])
-            hypothesis_annotation.quote = quote
-            hypothesis_annotation.tags = annotation["tags"]
-            hypothesis_annotation.link_html = annotation["links"]["html"]
-            hypothesis_annotation.link_incontext = annotation["links"]["incontext"]
-            hypothesis_annotation.shared = (
-                VisibilityEnum.PRIVATE
-                if annotation["hidden"]
-                else VisibilityEnum.PUBLIC
-            )
-            hypothesis_annotation.flagged = int(annotation["flagged"])
+            if r.status_code > 200:
+                logger.info("Couldn't call Hypothesis: (%s): %s", r.status_code, r.text)
+                raise exceptions.HypothesisError(r.status_code, r.text)
 
-            hypothesis_page.shared = (
-                VisibilityEnum.PRIVATE
-                if annotation["hidden"]
-                else VisibilityEnum.PUBLIC
-            )
+            rows = r.json()["rows"]
+            logger.debug("Got %s annotations after %s", len(rows), search_after)
+            if rows:
+                search_after = rows[-1]["updated"]
+                yield rows, search_after
+            if len(rows) < PAGE_SIZE:
+                break
+
+    def store_batch(self, session, batch):
+        for annotation in batch:
+            _store_annotation(session, annotation, self.page_cache)
 
-        # TODO: Is this important?
-        # if "group:__world__" in annotation["permissions"]["read"]:
-        session.commit()
-        logger.info("Added %s from %s.", annotation["uri"], annotation["updated"])
+
+def fetch(config):
+    """Update local Hypothesis database"""
+    HypothesisSource(config).run()
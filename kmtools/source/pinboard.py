@@ -1,81 +1,143 @@
 import logging
-from sqlite3 import IntegrityError
+from itertools import batched
 
-import requests
 from dateutil.parser import isoparse
 from sqlalchemy import desc, select
 
 from kmtools import exceptions
 from kmtools.models import Pinboard, VisibilityEnum
-from kmtools.util.database import get_session
+from kmtools.util.http_session import get_http_session
+from kmtools.util.json_stream import iter_json_array
+
+from .source_base import SourceBase
 
 logger = logging.getLogger(__name__)
 
+# Bookmarks are parsed from the streamed posts/all response and stored this
+# many at a time, so memory use doesn't grow with the size of the account.
+BATCH_SIZE = 500
+CHUNK_SIZE = 64 * 1024
 
-def get_or_create_pinboard(session, href, title, time):
-    try:
-        # Query to check if the Pinboard object already exists
-        stmt = select(Pinboard).where(Pinboard.href == href)
-        existing_pinboard = session.execute(stmt).scalars().first()
 
-        if existing_pinboard:
-            logger.info(
-                "Found existing Pinboard object for %s: %s", href, existing_pinboard
-            )
-            return existing_pinboard
-        else:
-            # If not exists, create a new one
-            logger.info("Creating new Pinboard object for %s", href)
-            new_pinboard = Pinboard(href=href)
-            session.add(new_pinboard)
-            return new_pinboard
+def get_existing_pinboards(session, hrefs):
+    """Look up the stored Pinboard objects for a batch of URLs in one query.
 
-    except IntegrityError:
-        # Handle potential race conditions, retry fetch
-        session.rollback()
-        return session.execute(stmt).scalars().first()
+    :param session: SQLAlchemy session
+    :param hrefs: URLs of the bookmarks in the batch
 
+    :return: Dictionary of Pinboard objects keyed by URL
+    """
+    stmt = select(Pinboard).where(Pinboard.href.in_(hrefs))
+    return {pinboard.href: pinboard for pinboard in session.execute(stmt).scalars()}
 
-def fetch(ctx_obj):
-    """Update local Pinboard database"""
 
+def get_update_time(ctx_obj) -> str:
+    """Ask Pinboard when the bookmarks were last changed.
+
+    `posts/update` is a tiny response that isn't subject to the heavy rate
+    limiting of `posts/all`, so it is used to decide whether a full download
+    is needed at all.
+
+    :raises PinboardError: Problem with the Pinboard API
+
+    :return: Pinboard's update timestamp, as reported by the API
+    """
     params = {
         "format": "json",
+        "auth_token": ctx_obj.pinboard.auth_token.get_secret_value(),
     }
+    r = get_http_session("pinboard").get(
+        f"{ctx_obj.pinboard.api_base_url}/posts/update", params=params
+    )
+    if r.status_code > 200:
+        logger.debug("Couldn't call Pinboard: (%s): %s", r.status_code, r.text)
+        raise exceptions.PinboardError(r.status_code, r.text)
+    return r.json()["update_time"]
 
-    with get_session() as session:
-        # Query the most recent Pinboard entry based on the 'time' column
-        stmt = select(Pinboard).order_by(desc(Pinboard.saved_timestamp)).limit(1)
 
-        # Execute the query
-        most_recent_pinboard = session.execute(stmt).scalars().first()
-        since_date = most_recent_pinboard.saved_timestamp
-        if since_date:
-            params["fromdt"] = (
-                since_date.replace(microsecond=0, tzinfo=None).isoformat() + "Z"
-            )
+def _initial_cursor(session):
+    """Derive a starting `fromdt` from the newest stored bookmark.
+
+    Used when there is no recorded cursor yet, such as on the first run after
+    upgrading. Returns None when there are no bookmarks at all, which makes
+    the first sync a full download.
+    """
+    stmt = select(Pinboard).order_by(desc(Pinboard.saved_timestamp)).limit(1)
+    most_recent_pinboard = session.execute(stmt).scalars().first()
+    if not most_recent_pinboard or not most_recent_pinboard.saved_timestamp:
+        return None
+    since_date = most_recent_pinboard.saved_timestamp
+    return since_date.replace(microsecond=0, tzinfo=None).isoformat() + "Z"
+
+
+class PinboardSource(SourceBase):
+    """Bookmarks saved to Pinboard"""
+
+    source_name = "pinboard"
+
+    @property
+    def fetch_timeout(self) -> float:
+        return self.config.pinboard.fetch_timeout
+
+    def fetch_batches(self, session, state):
+        """Stream new bookmarks from `posts/all` in fixed-size batches.
+
+        `posts/all` returns the newest bookmarks first, so the cursor can only
+        move forward after the whole response has been stored.
+        """
+        update_time = get_update_time(self.config)
+        if state.remote_updated == update_time:
+            logger.info("No Pinboard changes since %s; skipping download", update_time)
+            return
+
+        params = {
+            "format": "json",
+        }
+        since = state.cursor or _initial_cursor(session)
+        if since:
+            params["fromdt"] = since
 
         logger.debug("Calling Pinboard with %s (plus auth)", params)
-        params["auth_token"] = ctx_obj.pinboard.auth_token.get_secret_value()
+        params["auth_token"] = self.config.pinboard.auth_token.get_secret_value()
 
-        r = requests.get(
-            "https://api.pinboard.in/v1/posts/all", params=params, timeout=30
-        )
-        if r.status_code > 200:
-            logger.debug("Couldn't call Pinboard: (%s): %s", r.status_code, r.text)
-            raise exceptions.PinboardError(r.status_code, r.text)
-        logger.debug("Got response from Pinboard")
+        newest = since
+        with get_http_session("pinboard").get(
+            f"{self.config.pinboard.api_base_url}/posts/all", params=params, stream=True
+        ) as r:
+            if r.status_code > 200:
+                logger.debug("Couldn't call Pinboard: (%s): %s", r.status_code, r.text)
+                raise exceptions.PinboardError(r.status_code, r.text)
+            logger.debug("Got response from Pinboard")
 
-        for bookmark in r.json():
+            bookmarks = iter_json_array(r.iter_content(CHUNK_SIZE))
+            for batch in batched(bookmarks, BATCH_SIZE):
+                batch_newest = max(bookmark["time"] for bookmark in batch)
+                newest = max(newest, batch_newest) if newest else batch_newest
+                yield list(batch), None
+
+        # Only record the update time once everything it covers is stored
+        state.cursor = newest
+        state.remote_updated = update_time
+
+    def store_batch(self, session, batch):
+        existing = get_existing_pinboards(
+            session, [bookmark["href"] for bookmark in batch]
+        )
+        for bookmark in batch:
             logger.debug(
                 "Got bookmark %s, last updated %s", bookmark["href"], bookmark["time"]
             )
-            new_pinboard = get_or_create_pinboard(
-                session,
-                bookmark["href"],
-                bookmark["description"],
-                isoparse(bookmark["time"]),
-            )
+            new_pinboard = existing.get(bookmark["href"])
+            if new_pinboard:
+                logger.info(
+                    "Found existing Pinboard object for %s: %s",
+                    bookmark["href"],
+                    new_pinboard,
+                )
+            else:
+                logger.info("Creating new Pinboard object for %s", bookmark["href"])
+                new_pinboard = Pinboard(href=bookmark["href"])
+                session.add(new_pinboard)
             new_pinboard.hash = bookmark["hash"]
             new_pinboard.title = bookmark["description"]
             new_pinboard.description = bookmark["extended"]
@@ -89,4 +151,8 @@ def fetch(ctx_obj):
                 new_pinboard.shared = VisibilityEnum.PUBLIC
             else:
                 new_pinboard.shared = VisibilityEnum.PRIVATE
-            session.commit()
+
+
+def fetch(ctx_obj):
+    """Update local Pinboard database"""
+    PinboardSource(ctx_obj).run()
@@ -0,0 +1,103 @@
+"""Abstract base class for all activity sources"""
+
+import logging
+import threading
+from abc import abstractmethod
+from datetime import datetime, timezone
+from typing import Any, Iterator, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from kmtools.models import SyncState
+from kmtools.util.database import get_session
+
+logger = logging.getLogger(__name__)
+
+
+class SourceBase:
+    """Abstract Base Class for all activity sources.
+
+    A source pulls new and changed items from an external service in batches.
+    Each batch is stored in its own transaction together with the source's
+    cursor in the sync_state table, so an interrupted sync resumes from the
+    last stored batch. `stop()` asks a running sync to finish early: the
+    batch being fetched is dropped and nothing more is stored.
+
+    Subclasses must define:
+        - source_name: str
+        - fetch_timeout: float  (seconds the concurrent fetch stage allows)
+        - fetch_batches(session, state) -> Iterator[(batch, cursor)]
+        - store_batch(session, batch) -> None
+    """
+
+    source_name: str
+    fetch_timeout: float = 300
+
+    def __init__(self, config) -> None:
+        self.config = config
+        self._stop_requested = threading.Event()
+
+    def stop(self) -> None:
+        """Ask a running sync to stop before it stores another batch."""
+        self._stop_requested.set()
+
+    # -- Methods subclasses must implement --
+
+    @abstractmethod
+    def fetch_batches(
+        self, session: Session, state: SyncState
+    ) -> Iterator[Tuple[List[Any], Optional[str]]]:
+        """Yield batches of raw items newer than `state.cursor`.
+
+        Each batch comes with the cursor to checkpoint once it is stored, or
+        None if the cursor can't advance yet. Code after the final `yield`
+        runs once every batch has been committed.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def store_batch(self, session: Session, batch: List[Any]) -> None:
+        """Add or update the items of one batch in the session, without committing."""
+        raise NotImplementedError
+
+    # -- The shared sync loop --
+
+    def run(self) -> None:
+        """Sync all new items from the source."""
+        with get_session() as session:
+            state = SyncState.for_source(session, self.source_name)
+            item_count = 0
+            error: Optional[Exception] = None
+            try:
+                for batch, cursor in self.fetch_batches(session, state):
+                    if self._stop_requested.is_set():
+                        raise TimeoutError(f"{self.source_name} sync was stopped")
+                    self.store_batch(session, batch)
+                    if cursor is not None:
+                        state.cursor = cursor
+                    session.commit()
+                    item_count += len(batch)
+                    logger.debug(
+                        "(%s) Stored batch of %s; cursor %s",
+                        self.source_name,
+                        len(batch),
+                        state.cursor,
+                    )
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                session.rollback()
+                session.add(state)
+                error = e
+
+            # Batches committed before a failure still count
+            state.items_last_run = item_count
+            state.items_total = (state.items_total or 0) + item_count
+            if error:
+                state.last_error = str(error)
+            else:
+                state.last_success = datetime.now(timezone.utc)
+                state.last_error = None
+            session.commit()
+
+        if error:
+            raise error
+        logger.info("(%s) Synced %s items", self.source_name, item_count)
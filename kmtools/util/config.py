@@ -4,7 +4,7 @@ from __future__ import annotations
 
 import logging
 from pathlib import Path
-from typing import Any
+from typing import Any, Literal
 
 from pydantic import BaseModel, PrivateAttr, SecretStr
 from pydantic_settings import (
@@ -26,6 +26,9 @@ logger = logging.getLogger(__name__)
 class KMToolsSettings(BaseModel):
     logfile: Path
     dbfile: Path = Path("kmtools.sqlite3")
+    http_cache_file: Path = Path("http_cache.sqlite3")
+    http_cache_max_bytes: int = 256 * 1024 * 1024
+    http_cache_default_ttl: int = 3600
 
 
 class TwitterSettings(BaseModel):
@@ -44,16 +47,29 @@ class MastodonSettings(BaseModel):
 
 class PinboardSettings(BaseModel):
     auth_token: SecretStr
+    api_base_url: str = "https://api.pinboard.in/v1"
+    fetch_timeout: float = 300
 
 
 class HypothesisSettings(BaseModel):
     user: str
     api_token: SecretStr
+    api_base_url: str = "https://api.hypothes.is/api"
+    fetch_timeout: float = 600
 
 
 class WaybackSettings(BaseModel):
     access_key: str
     secret_key: SecretStr
+    api_base_url: str = "https://web.archive.org"
+    # Reuse an existing capture younger than this instead of asking Save Page
+    # Now for a new one; 0 always captures
+    max_capture_age_days: float = 30
+    precheck_workers: int = 8
+    status_batch_size: int = 50
+    status_poll_delays: list[float] = [5, 10, 20]
+    slot_poll_interval: float = 5
+    max_slot_wait: float = 300
 
 
 class ObsidianSettings(BaseModel):
@@ -65,6 +81,58 @@ class ObsidianSettings(BaseModel):
 
 class KagiSettings(BaseModel):
     api_token: SecretStr
+    api_base_url: str = "https://kagi.com/api/v0"
+    engine: str = "cecil"
+    # Send Kagi the text already extracted from a document rather than its
+    # URL, so Kagi doesn't fetch the page again; URLs are sent when there is
+    # no text
+    send_text: bool = False
+    # Reuse a stored summary of the same URL and engine younger than this
+    # instead of paying for a new one; 0 always asks Kagi
+    cache_ttl_days: float = 30
+    # Kagi's price, applied to the tokens each summary reports
+    cost_per_1000_tokens: float = 0.03
+    # Stop calling Kagi once this much (USD) is spent; None for no limit
+    run_budget: float | None = None
+    monthly_budget: float | None = None
+
+
+class SummarizeSettings(BaseModel):
+    # "frequency" scores words by their frequency in the document; "textrank"
+    # weighs them against the corpus index and ranks sentences by TextRank
+    mode: Literal["frequency", "textrank"] = "frequency"
+    fetch_workers: int = 8
+    extract_workers: int = 2
+    queue_size: int = 16
+    task_cpu_seconds: float = 30
+    task_memory_bytes: int = 1024 * 1024 * 1024
+    tasks_per_worker: int = 10
+    # Downloads stop here; the same as trafilatura's MAX_FILE_SIZE
+    max_document_bytes: int = 20_000_000
+    # PDFs are summarized from their first pages
+    pdf_max_pages: int = 30
+    # Load NLTK and trafilatura when a worker starts, not during its first task
+    prewarm: bool = True
+
+
+class HttpSettings(BaseModel):
+    default_timeout: float = 30
+    timeouts: dict[str, float] = {
+        "pinboard": 30,
+        "hypothesis": 20,
+        "kagi": 60,
+        "wayback": 10,
+        "web": 30,
+    }
+    pool_connections: int = 4
+    pool_maxsize: int = 10
+    retries: int = 3
+    # Services retried a different number of times; a retried Kagi summary
+    # could be billed twice
+    service_retries: dict[str, int] = {"kagi": 0}
+    backoff_factor: float = 0.5
+    # Longest Retry-After wait honoured before a retry
+    max_retry_after: float = 10
 
 
 class Config(BaseSettings):
@@ -90,6 +158,8 @@ class Config(BaseSettings):
     wayback: WaybackSettings
     obsidian: ObsidianSettings
     kagi: KagiSettings
+    http: HttpSettings = HttpSettings()
+    summarize: SummarizeSettings = SummarizeSettings()
 
     _config_file: Path = PrivateAttr(default=DEFAULT_CONFIG_FILE)
 
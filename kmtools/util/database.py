@@ -1,9 +1,10 @@
 from __future__ import annotations
 
 import logging
+import threading
 from pathlib import Path
 
-from sqlalchemy import Engine, create_engine
+from sqlalchemy import Engine, create_engine, inspect, text
 from sqlalchemy.engine import URL
 from sqlalchemy.orm import DeclarativeBase, sessionmaker
 from sqlalchemy.orm import Session as SQLAlchemySession
@@ -20,6 +21,8 @@ class Base(DeclarativeBase):
 _engine: Engine | None = None
 _engine_db_path: Path | None = None
 _session_factory: sessionmaker[SQLAlchemySession] | None = None
+# Creating the engine also creates tables, so only one thread may do it
+_engine_lock = threading.RLock()
 
 
 def get_database_path(config: Config | None = None) -> Path:
@@ -47,15 +50,18 @@ def get_engine(config: Config | None = None) -> Engine:
     Return the SQLAlchemy engine for the configured database.
 
     The engine is created lazily so importing this module does not initialize
-    configuration too early.
+    configuration too early. It is safe to call from several threads.
     """
 
+    with _engine_lock:
+        return _get_engine(get_database_path(config))
+
+
+def _get_engine(db_path: Path) -> Engine:
     global _engine
     global _engine_db_path
     global _session_factory
 
-    db_path = get_database_path(config)
-
     if _engine is None or _engine_db_path != db_path:
         if _engine is not None:
             _engine.dispose()
@@ -77,9 +83,51 @@ def get_engine(config: Config | None = None) -> Engine:
         _engine_db_path = db_path
         _session_factory = None
 
+        _create_missing_tables(_engine)
+        _add_missing_columns(_engine)
+
     return _engine
 
 
+def _create_missing_tables(engine: Engine) -> None:
+    """
+    Create any model tables that do not exist yet in the database.
+
+    Existing tables are left untouched, so this is safe to run against a
+    database that was built by an earlier version of kmtools.
+    """
+
+    # Importing the models registers their tables with Base.metadata.
+    import kmtools.models  # noqa: F401  pylint: disable=import-outside-toplevel,unused-import
+
+    Base.metadata.create_all(engine)
+
+
+def _add_missing_columns(engine: Engine) -> None:
+    """
+    Add nullable columns that newer models define to existing tables.
+
+    This covers the simple case of a model gaining an optional field; anything
+    more involved still needs a proper migration.
+    """
+
+    inspector = inspect(engine)
+    with engine.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing or not column.nullable:
+                    continue
+                column_type = column.type.compile(dialect=engine.dialect)
+                logger.info("Adding column %s.%s", table.name, column.name)
+                connection.execute(
+                    text(
+                        f'ALTER TABLE "{table.name}" '
+                        f'ADD COLUMN "{column.name}" {column_type}'
+                    )
+                )
+
+
 def get_session_factory(
     config: Config | None = None,
 ) -> sessionmaker[SQLAlchemySession]:
@@ -89,12 +137,13 @@ def get_session_factory(
 
     global _session_factory
 
-    engine = get_engine(config)
+    with _engine_lock:
+        engine = get_engine(config)
 
-    if _session_factory is None:
-        _session_factory = sessionmaker(bind=engine)
+        if _session_factory is None:
+            _session_factory = sessionmaker(bind=engine)
 
-    return _session_factory
+        return _session_factory
 
 
 def get_session(config: Config | None = None) -> SQLAlchemySession:
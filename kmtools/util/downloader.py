@@ -0,0 +1,145 @@
+"""Bounded, streaming downloads of documents to summarize.
+
+Bookmarks point at PDFs, videos and other media as well as web pages. A
+plain GET reads the whole body before anything looks at it, so a video is
+downloaded in full only for extraction to fail. `bounded_get()` streams
+instead:
+
+- The `Content-Type` header is checked before any of the body is read, and
+  media and other types without text are abandoned at once. Generic binary
+  types are sniffed from the first chunk, since PDFs are often served that way.
+- A `Content-Length` over the byte cap is abandoned before reading, and a
+  body that grows past it while streaming is abandoned there.
+
+`bounded_get()` fits the `fetch` parameter of `HttpCache.get()`, so only
+documents worth keeping reach the cache. `document_kind()` routes a response,
+cached or not, to the right extractor.
+"""
+
+from __future__ import annotations
+
+import enum
+import logging
+from dataclasses import dataclass
+from typing import Mapping, Optional
+
+import requests
+
+from kmtools.exceptions import DocumentTooLargeError, UnsupportedDocumentError
+
+from .http_cache import Extraction
+from .http_session import get_http_session
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+
+PDF_MAGIC = b"%PDF-"
+
+HTML_TYPES = frozenset({"text/html", "application/xhtml+xml"})
+PDF_TYPES = frozenset({"application/pdf", "application/x-pdf"})
+# Types that say nothing about the content, so the body is sniffed
+SNIFFED_TYPES = frozenset(
+    {"application/octet-stream", "binary/octet-stream", "application/download"}
+)
+
+
+class DocumentKind(enum.Enum):
+    """How the text of a document is extracted."""
+
+    HTML = "html"
+    PDF = "pdf"
+    UNSUPPORTED = "unsupported"
+
+
+@dataclass(frozen=True)
+class Download:
+    """A document body and the extractor it is routed to.
+
+    `content_hash` is the SHA-256 of the body, and `extraction` what its
+    extractor already made of it, if that is stored.
+    """
+
+    body: bytes
+    kind: DocumentKind
+    content_hash: Optional[str] = None
+    extraction: Optional[Extraction] = None
+
+
+def _media_type(content_type: Optional[str]) -> str:
+    return (content_type or "").split(";")[0].strip().lower()
+
+
+def document_kind(content_type: Optional[str], head: bytes = b"") -> DocumentKind:
+    """Classify a document by its Content-Type and the start of its body.
+
+    Documents without a Content-Type are assumed to be HTML, as before.
+
+    :param content_type: The Content-Type header, if any
+    :param head: The first bytes of the body, for sniffing generic types
+    """
+    media_type = _media_type(content_type)
+    if not media_type or media_type in HTML_TYPES:
+        return DocumentKind.HTML
+    if media_type in PDF_TYPES:
+        return DocumentKind.PDF
+    if media_type in SNIFFED_TYPES and head.startswith(PDF_MAGIC):
+        return DocumentKind.PDF
+    return DocumentKind.UNSUPPORTED
+
+
+def bounded_get(
+    url: str,
+    *,
+    max_bytes: int,
+    headers: Optional[Mapping[str, str]] = None,
+    timeout: Optional[float] = None,
+    service: str = "web",
+) -> requests.Response:
+    """GET a document, giving up as soon as it can't be summarized.
+
+    Responses other than 200 are read under the same cap but not routed.
+
+    :param url: URL to retrieve
+    :param max_bytes: Largest body to read
+    :param headers: Additional request headers
+    :param timeout: Timeout for the request; defaults to the session's
+    :param service: Name of the pooled HTTP session to use
+
+    :raises UnsupportedDocumentError: when the document is media or another
+        type without text
+    :raises DocumentTooLargeError: when the body is larger than `max_bytes`
+
+    :returns: The response, with its body read
+    """
+    response = get_http_session(service).get(
+        url, headers=headers, timeout=timeout, stream=True
+    )
+    with response:
+        content_type = response.headers.get("Content-Type")
+        routed = response.status_code == 200
+        if (
+            routed
+            and _media_type(content_type) not in SNIFFED_TYPES
+            and document_kind(content_type) is DocumentKind.UNSUPPORTED
+        ):
+            raise UnsupportedDocumentError(f"{url} is {_media_type(content_type)}")
+
+        length = response.headers.get("Content-Length", "")
+        if length.isdigit() and int(length) > max_bytes:
+            raise DocumentTooLargeError(f"{url} is {length} bytes")
+
+        body = bytearray()
+        for chunk in response.iter_content(CHUNK_SIZE):
+            if routed and not body:
+                if document_kind(content_type, chunk) is DocumentKind.UNSUPPORTED:
+                    raise UnsupportedDocumentError(
+                        f"{url} is {_media_type(content_type)}"
+                    )
+            body += chunk
+            if len(body) > max_bytes:
+                raise DocumentTooLargeError(f"{url} is over {max_bytes} bytes")
+
+    response._content = bytes(body)  # pylint: disable=protected-access
+    logger.debug("Downloaded %s bytes from %s", len(body), url)
+    return response
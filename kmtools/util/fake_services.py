@@ -0,0 +1,555 @@
+"""Local stand-ins for the external services kmtools talks to.
+
+The harness is one small HTTP server that implements the parts of the
+Pinboard, Hypothesis, Kagi, Wayback Save Page Now and Mastodon APIs that
+kmtools uses. Each service lives under its own path prefix, and each can be
+given a latency distribution, an error rate and a rate limit, so that
+concurrency, retries and backoff can be measured without live accounts.
+
+Usage:
+
+    with FakeServices(items=5000) as fake:
+        config = build_config(**fake.config_overrides())
+        ...
+
+or from the command line with `kmtools fake-services`, which prints the
+environment variables that point the configuration at the harness.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import random
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+logger = logging.getLogger(__name__)
+
+SERVICES = ("pinboard", "hypothesis", "kagi", "wayback", "mastodon")
+
+# Path prefix of each service; the configured base URL is server URL + prefix
+API_PREFIXES = {
+    "pinboard": "/pinboard/v1",
+    "hypothesis": "/hypothesis/api",
+    "kagi": "/kagi/api/v0",
+    "wayback": "/wayback",
+    "mastodon": "/mastodon",
+}
+
+
+def parse_latency(spec: str) -> Callable[[], float]:
+    """Turn a latency specification into a function returning seconds.
+
+    Accepted forms are `fixed:SECONDS`, `uniform:LOW,HIGH` and
+    `lognormal:MU,SIGMA` (parameters of the underlying normal distribution,
+    so `lognormal:-2.3,0.5` has a median of about 100 ms).
+
+    :raises ValueError: if the specification can't be parsed
+    """
+    kind, _, args = spec.partition(":")
+    try:
+        params = [float(arg) for arg in args.split(",")] if args else []
+    except ValueError as e:
+        raise ValueError(f"Bad latency parameters in {spec!r}") from e
+
+    if kind == "fixed" and len(params) == 1:
+        return lambda: params[0]
+    if kind == "uniform" and len(params) == 2:
+        return lambda: random.uniform(params[0], params[1])
+    if kind == "lognormal" and len(params) == 2:
+        return lambda: random.lognormvariate(params[0], params[1])
+    raise ValueError(
+        f"Unknown latency {spec!r}; use fixed:S, uniform:LOW,HIGH or lognormal:MU,SIGMA"
+    )
+
+
+class TokenBucket:
+    """Thread-safe token bucket used to rate limit one fake service."""
+
+    def __init__(self, rate: float, burst: Optional[int] = None) -> None:
+        self.rate = rate
+        self.capacity = burst or max(1, int(rate))
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def take(self) -> float:
+        """Take a token; return 0 on success or the seconds until one is free."""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(
+                self.capacity, self.tokens + (now - self.updated) * self.rate
+            )
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+            return (1 - self.tokens) / self.rate
+
+
+@dataclass
+class ServiceBehavior:
+    """How one fake service misbehaves.
+
+    :param latency: Latency specification, see `parse_latency()`
+    :param error_rate: Fraction of requests answered with a 5xx error
+    :param rate_limit: Requests per second allowed before answering 429, or
+        None for no limit
+    :param burst: Requests allowed in a burst; defaults to the rate
+    """
+
+    latency: str = "fixed:0"
+    error_rate: float = 0.0
+    rate_limit: Optional[float] = None
+    burst: Optional[int] = None
+
+    def __post_init__(self) -> None:
+        self.delay = parse_latency(self.latency)
+        self.bucket = (
+            TokenBucket(self.rate_limit, self.burst) if self.rate_limit else None
+        )
+
+
+@dataclass
+class ServiceStats:
+    """Counters for one fake service."""
+
+    requests: int = 0
+    errors: int = 0
+    rate_limited: int = 0
+
+
+@dataclass
+class FakeData:
+    """The bookmarks, annotations and jobs the fake services serve."""
+
+    items: int = 1000
+    seed: int = 0
+    # Seconds before a Save Page Now job reports success
+    capture_delay: float = 0.0
+    # Save Page Now limits on concurrent and daily captures
+    capture_slots: int = 5
+    daily_captures: int = 100000
+    # Seconds Kagi spends fetching a URL it is asked to summarize, and the
+    # fraction of URLs it can't fetch (paywalled or blocking bots)
+    kagi_fetch_delay: float = 0.0
+    kagi_blocked_rate: float = 0.0
+    bookmarks: List[Dict[str, Any]] = field(default_factory=list)
+    annotations: List[Dict[str, Any]] = field(default_factory=list)
+    jobs: Dict[str, Tuple[float, str]] = field(default_factory=dict)
+    # Capture timestamps by URL, oldest first
+    captures: Dict[str, List[str]] = field(default_factory=dict)
+    toots: List[Dict[str, Any]] = field(default_factory=list)
+
+    def __post_init__(self) -> None:
+        rng = random.Random(self.seed)
+        start = datetime(2020, 1, 1, tzinfo=timezone.utc)
+        now = datetime.now(timezone.utc)
+        for n in range(self.items):
+            saved = start + timedelta(minutes=n * 7)
+            href = f"https://example.com/{n // 3}/article-{n}"
+            self.bookmarks.append(
+                {
+                    "href": href,
+                    "description": f"Article {n}",
+                    "extended": f"Notes about article {n}",
+                    "meta": hashlib.md5(f"meta{n}".encode()).hexdigest(),
+                    "hash": hashlib.md5(href.encode()).hexdigest(),
+                    "time": saved.strftime("%Y-%m-%dT%H:%M:%SZ"),
+                    "shared": "yes" if rng.random() < 0.8 else "no",
+                    "toread": "no",
+                    "tags": " ".join(rng.sample(["web", "library", "open-access"], 2)),
+                }
+            )
+            # Half the bookmarks were captured when saved, some of them again lately
+            if n % 2 == 0:
+                self.captures[href] = [saved.strftime("%Y%m%d%H%M%S")]
+                if n % 4 == 0:
+                    recent = now - timedelta(hours=rng.uniform(1, 24 * 60))
+                    self.captures[href].append(recent.strftime("%Y%m%d%H%M%S"))
+            updated = saved.isoformat(timespec="microseconds").replace("+00:00", "Z")
+            annotation_id = uuid.UUID(int=rng.getrandbits(128)).hex[:22]
+            self.annotations.append(
+                {
+                    "id": annotation_id,
+                    "created": updated,
+                    "updated": updated,
+                    "user": "acct:fake@hypothes.is",
+                    "uri": f"https://example.com/{n // 5}/annotated",
+                    "text": f"Annotation {n}",
+                    "tags": ["fake"],
+                    "target": [
+                        {
+                            "source": f"https://example.com/{n // 5}/annotated",
+                            "selector": [
+                                {"type": "TextQuoteSelector", "exact": f"Quote {n}"}
+                            ],
+                        }
+                    ],
+                    "document": {"title": [f"Annotated page {n // 5}"]},
+                    "links": {
+                        "html": f"https://hypothes.is/a/{annotation_id}",
+                        "incontext": f"https://hyp.is/{annotation_id}/example.com",
+                    },
+                    "hidden": rng.random() < 0.1,
+                    "flagged": False,
+                }
+            )
+        # Pinboard returns the newest bookmarks first
+        self.bookmarks.reverse()
+
+
+class _FakeServiceHandler(BaseHTTPRequestHandler):
+    server: "_FakeServer"
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out in separate writes; without TCP_NODELAY the
+    # second waits on the client's delayed ACK, adding ~40 ms to each reply
+    disable_nagle_algorithm = True
+    _body = b""
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        logger.debug("%s - %s", self.address_string(), format % args)
+
+    # -- Plumbing --
+
+    def _send_json(self, status: int, body: Any, headers: Dict[str, str] = None):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _read_form(self) -> Dict[str, str]:
+        body = self._body.decode()
+        if self.headers.get("Content-Type", "").startswith("application/json"):
+            return json.loads(body or "{}")
+        return {key: values[-1] for key, values in parse_qs(body).items()}
+
+    def _dispatch(self, method: str) -> None:
+        # Read the body before any reply, even an early error, so the next
+        # request on this keep-alive connection starts at its own first byte
+        length = int(self.headers.get("Content-Length") or 0)
+        self._body = self.rfile.read(length) if length else b""
+        parts = urlsplit(self.path)
+        service = next(
+            (
+                name
+                for name, prefix in API_PREFIXES.items()
+                if parts.path.startswith(prefix + "/")
+            ),
+            None,
+        )
+        if service is None:
+            self._send_json(404, {"error": "unknown service"})
+            return
+        path = parts.path[len(API_PREFIXES[service]) :]
+        query = {key: values[-1] for key, values in parse_qs(parts.query).items()}
+        behavior = self.server.behaviors[service]
+        stats = self.server.stats[service]
+
+        with self.server.stats_lock:
+            stats.requests += 1
+        if behavior.bucket:
+            wait = behavior.bucket.take()
+            if wait:
+                with self.server.stats_lock:
+                    stats.rate_limited += 1
+                self._send_json(
+                    429,
+                    {"error": "rate limited"},
+                    {"Retry-After": str(max(1, round(wait)))},
+                )
+                return
+        time.sleep(max(0.0, behavior.delay()))
+        if behavior.error_rate and random.random() < behavior.error_rate:
+            with self.server.stats_lock:
+                stats.errors += 1
+            self._send_json(random.choice((500, 502, 503)), {"error": "fake failure"})
+            return
+
+        handler = getattr(self, f"_{service}", None)
+        try:
+            status, body = handler(method, path, query)
+        except KeyError as e:
+            status, body = 400, {"error": f"missing parameter {e}"}
+        self._send_json(status, body)
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        self._dispatch("GET")
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        self._dispatch("POST")
+
+    # -- Services --
+
+    def _pinboard(self, method, path, query):
+        data = self.server.data
+        if method == "GET" and path == "/posts/update":
+            newest = data.bookmarks[0]["time"] if data.bookmarks else None
+            return 200, {"update_time": newest}
+        if method == "GET" and path == "/posts/all":
+            fromdt = query.get("fromdt")
+            return 200, [
+                bookmark
+                for bookmark in data.bookmarks
+                if not fromdt or bookmark["time"] > fromdt
+            ]
+        return 404, {"error": "not found"}
+
+    def _hypothesis(self, method, path, query):
+        if method != "GET" or path != "/search":
+            return 404, {"error": "not found"}
+        rows = self.server.data.annotations
+        if query.get("order") == "desc":
+            rows = rows[::-1]
+        search_after = query.get("search_after")
+        if search_after:
+            rows = [row for row in rows if row["updated"] > search_after]
+        limit = min(int(query.get("limit", 20)), 200)
+        return 200, {"total": len(rows), "rows": rows[:limit]}
+
+    def _kagi(self, method, path, query):
+        if method not in ("GET", "POST") or path != "/summarize":
+            return 404, {"error": [{"code": 404, "msg": "not found"}]}
+        data = self.server.data
+        params = {**query, **self._read_form()} if method == "POST" else query
+        meta = {"id": uuid.uuid4().hex, "node": "fake", "ms": 0}
+        if "text" in params:
+            words = len(params["text"].split())
+            output = f"A summary of {words} words. It covers the main points."
+            tokens = words + len(output.split())
+        else:
+            url = params["url"]
+            time.sleep(data.kagi_fetch_delay)
+            # The same URLs are always blocked, as a paywall would be
+            digest = hashlib.md5(url.encode()).digest()
+            if int.from_bytes(digest[:4]) / 2**32 < data.kagi_blocked_rate:
+                return 400, {
+                    "meta": meta,
+                    "error": [{"code": 1, "msg": f"Unable to retrieve {url}"}],
+                }
+            output = f"A summary of {url}. It covers the main points of the document."
+            tokens = len(output.split())
+        return 200, {"meta": meta, "data": {"output": output, "tokens": tokens}}
+
+    def _wayback(self, method, path, query):
+        data = self.server.data
+        if method == "POST" and path == "/save":
+            url = self._read_form()["url"]
+            job_id = f"spn2-{uuid.uuid4().hex}"
+            with self.server.stats_lock:
+                usage = self._wayback_user()
+                if usage["daily_captures"] >= data.daily_captures:
+                    return 200, {
+                        "status": "error",
+                        "status_ext": "error:too-many-daily-captures",
+                        "message": "You have reached your daily capture limit.",
+                    }
+                if not usage["available"]:
+                    return 200, {
+                        "status": "error",
+                        "status_ext": "error:user-session-limit",
+                        "message": "You have already reached the limit of active "
+                        "sessions.",
+                    }
+                data.jobs[job_id] = (time.time(), url)
+            return 200, {"url": url, "job_id": job_id}
+        if method == "GET" and path == "/save/status/user":
+            with self.server.stats_lock:
+                return 200, self._wayback_user()
+        if method == "POST" and path == "/save/status":
+            job_ids = self._read_form()["job_ids"].split(",")
+            return 200, [self._wayback_status(job_id) for job_id in job_ids]
+        if method == "GET" and path.startswith("/save/status/"):
+            return 200, self._wayback_status(path.rsplit("/", 1)[-1])
+        if method == "GET" and path == "/cdx/search/cdx":
+            return 200, self._wayback_cdx(query)
+        return 404, {"error": "not found"}
+
+    def _wayback_user(self) -> Dict[str, int]:
+        data = self.server.data
+        now = time.time()
+        processing = sum(
+            1 for started, _ in data.jobs.values() if now - started < data.capture_delay
+        )
+        return {
+            "available": max(0, data.capture_slots - processing),
+            "processing": processing,
+            "daily_captures": len(data.jobs),
+            "daily_captures_limit": data.daily_captures,
+        }
+
+    def _wayback_cdx(self, query: Dict[str, str]) -> List[List[str]]:
+        """Answer a CDX query with `output=json`; only `url` and `limit` count."""
+        url = query["url"]
+        timestamps = self.server.data.captures.get(url, [])
+        limit = int(query.get("limit", 0))
+        if limit < 0:
+            timestamps = timestamps[limit:]
+        elif limit > 0:
+            timestamps = timestamps[:limit]
+        if not timestamps:
+            return []
+        return [["timestamp", "original"]] + [[ts, url] for ts in timestamps]
+
+    def _wayback_status(self, job_id: str) -> Dict[str, Any]:
+        data = self.server.data
+        job = data.jobs.get(job_id)
+        if job is None:
+            return {
+                "job_id": job_id,
+                "status": "error",
+                "status_ext": "error:not-found",
+                "message": "Job not found",
+            }
+        started, url = job
+        if time.time() - started < data.capture_delay:
+            return {"job_id": job_id, "status": "pending", "resources": []}
+        timestamp = datetime.fromtimestamp(
+            started + data.capture_delay, timezone.utc
+        ).strftime("%Y%m%d%H%M%S")
+        with self.server.stats_lock:
+            captures = data.captures.setdefault(url, [])
+            if timestamp not in captures:
+                captures.append(timestamp)
+        return {
+            "job_id": job_id,
+            "status": "success",
+            "original_url": url,
+            "timestamp": timestamp,
+            "duration_sec": data.capture_delay,
+            "resources": [url],
+        }
+
+    def _mastodon(self, method, path, query):
+        if method == "GET" and path in ("/api/v1/instance", "/api/v2/instance"):
+            return 200, {
+                "uri": "fake.example",
+                "title": "Fake Mastodon",
+                "version": "4.3.0",
+                "api_versions": {"mastodon": 2},
+            }
+        if method == "POST" and path == "/api/v1/statuses":
+            with self.server.stats_lock:
+                toot_id = str(len(self.server.data.toots) + 1)
+                toot = {
+                    "id": toot_id,
+                    "uri": f"https://fake.example/users/kmtools/statuses/{toot_id}",
+                    "content": self._read_form().get("status", ""),
+                    "created_at": datetime.now(timezone.utc).isoformat(),
+                }
+                self.server.data.toots.append(toot)
+            return 200, toot
+        return 404, {"error": "Record not found"}
+
+
+class _FakeServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, data: FakeData, behaviors):
+        super().__init__(address, _FakeServiceHandler)
+        self.data = data
+        self.behaviors = behaviors
+        self.stats = {service: ServiceStats() for service in SERVICES}
+        self.stats_lock = threading.Lock()
+
+
+class FakeServices:
+    """Run the fake services in a background thread.
+
+    :param host: Interface to listen on
+    :param port: Port to listen on; 0 picks a free one
+    :param items: Number of bookmarks and annotations to serve
+    :param behaviors: Per-service `ServiceBehavior`; missing services behave
+        perfectly
+    :param capture_delay: Seconds before a Save Page Now job succeeds
+    :param capture_slots: Save Page Now captures allowed to run at once
+    :param daily_captures: Save Page Now captures allowed per run of the
+        harness
+    :param kagi_fetch_delay: Seconds Kagi takes to fetch a URL itself
+    :param kagi_blocked_rate: Fraction of URLs Kagi can't fetch
+    :param seed: Seed for the generated data
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        items: int = 1000,
+        behaviors: Optional[Dict[str, ServiceBehavior]] = None,
+        capture_delay: float = 0.0,
+        capture_slots: int = 5,
+        daily_captures: int = 100000,
+        kagi_fetch_delay: float = 0.0,
+        kagi_blocked_rate: float = 0.0,
+        seed: int = 0,
+    ) -> None:
+        behaviors = behaviors or {}
+        self.server = _FakeServer(
+            (host, port),
+            FakeData(
+                items=items,
+                seed=seed,
+                capture_delay=capture_delay,
+                capture_slots=capture_slots,
+                daily_captures=daily_captures,
+                kagi_fetch_delay=kagi_fetch_delay,
+                kagi_blocked_rate=kagi_blocked_rate,
+            ),
+            {
+                service: behaviors.get(service, ServiceBehavior())
+                for service in SERVICES
+            },
+        )
+        self.thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def base_urls(self) -> Dict[str, str]:
+        return {service: self.url + prefix for service, prefix in API_PREFIXES.items()}
+
+    @property
+    def stats(self) -> Dict[str, ServiceStats]:
+        return self.server.stats
+
+    def config_overrides(self) -> Dict[str, Dict[str, str]]:
+        """Settings that point a `Config` at these services."""
+        return {
+            service: {"api_base_url": base_url}
+            for service, base_url in self.base_urls.items()
+        }
+
+    def start(self) -> "FakeServices":
+        self.thread = threading.Thread(
+            target=self.server.serve_forever, name="fake-services", daemon=True
+        )
+        self.thread.start()
+        logger.info("Fake services listening on %s", self.url)
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+        if self.thread:
+            self.thread.join()
+
+    def __enter__(self) -> "FakeServices":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
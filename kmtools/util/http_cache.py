@@ -0,0 +1,468 @@
+"""Persistent HTTP response cache with conditional revalidation.
+
+Responses are kept in a small SQLite database next to the main kmtools
+database. A cached response is served directly while it is fresh; once it is
+stale the next request carries `If-None-Match`/`If-Modified-Since` so an
+unchanged resource costs a `304 Not Modified` instead of a full download.
+The cache is bounded in size and evicts the least recently used entries.
+
+Bodies are stored once per distinct content, zlib-compressed and keyed by
+their SHA-256 hash, so the same document served from several URLs (mirrors,
+tracking parameters, redirects) takes space only once. `lookup()` returns the
+last stored copy of a URL regardless of freshness, for actions that want the
+document they already fetched rather than the current one.
+
+The text and date extracted from a stored document can be kept alongside it,
+keyed by the body's hash and the extractor that produced them, so a document
+is parsed only once however often it is refetched. They go when the document
+does.
+
+Fetch paths opt in by calling `cached_get()` instead of `requests.get()`.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+import zlib
+from collections import Counter
+from contextlib import contextmanager
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+from pathlib import Path
+from typing import Callable, Iterator, Mapping, Optional
+
+import requests
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+from .config import Config, get_config
+from .http_session import get_http_session
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    content_hash TEXT PRIMARY KEY,
+    body BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    stored_size INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS responses (
+    url TEXT PRIMARY KEY,
+    status_code INTEGER NOT NULL,
+    headers TEXT NOT NULL,
+    content_hash TEXT NOT NULL REFERENCES documents (content_hash),
+    etag TEXT,
+    last_modified TEXT,
+    stored_at REAL NOT NULL,
+    expires_at REAL NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access);
+CREATE INDEX IF NOT EXISTS responses_content_hash ON responses (content_hash);
+CREATE TABLE IF NOT EXISTS extractions (
+    content_hash TEXT NOT NULL REFERENCES documents (content_hash),
+    extractor TEXT NOT NULL,
+    text BLOB,
+    date TEXT,
+    PRIMARY KEY (content_hash, extractor)
+);
+"""
+
+COMPRESSION_LEVEL = 6
+
+# Only headers that describe the body are worth keeping
+_STORED_HEADERS = (
+    "Content-Type",
+    "Content-Language",
+    "Content-Location",
+    "Date",
+    "ETag",
+    "Last-Modified",
+    "Cache-Control",
+    "Expires",
+)
+
+
+def _parse_cache_control(value: str) -> dict[str, Optional[str]]:
+    directives: dict[str, Optional[str]] = {}
+    for part in value.split(","):
+        name, _, argument = part.strip().partition("=")
+        if name:
+            directives[name.lower()] = argument.strip('"') or None
+    return directives
+
+
+def freshness_lifetime(headers: Mapping[str, str], default_ttl: int) -> float:
+    """Return how many seconds a response may be served without revalidation.
+
+    Follows `Cache-Control` (`no-cache`, `s-maxage`, `max-age`), then
+    `Expires`, and otherwise falls back to a heuristic default.
+    """
+    directives = _parse_cache_control(headers.get("Cache-Control", ""))
+    if "no-cache" in directives:
+        return 0
+    for directive in ("s-maxage", "max-age"):
+        if directives.get(directive):
+            try:
+                return max(0, int(directives[directive]))
+            except ValueError:
+                pass
+    if expires := headers.get("Expires"):
+        try:
+            return max(0.0, parsedate_to_datetime(expires).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return 0
+    return default_ttl
+
+
+@dataclass
+class StoredDocument:
+    """The last stored copy of a URL."""
+
+    url: str
+    content_hash: str
+    status_code: int
+    headers: dict[str, str]
+    body: bytes
+    stored_at: float
+
+
+@dataclass(frozen=True)
+class Extraction:
+    """Text and publication date extracted from a document."""
+
+    text: Optional[str]
+    date: Optional[str]
+
+
+class HttpCache:
+    """SQLite-backed HTTP response cache and content-addressed document store.
+
+    Args:
+        path: Location of the cache database
+        max_bytes: Total compressed body size above which least recently used
+            entries are evicted
+        default_ttl: Freshness lifetime, in seconds, for responses that don't
+            say how long they may be cached
+    """
+
+    def __init__(self, path: Path, max_bytes: int, default_ttl: int) -> None:
+        self.path = path
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self.stats: Counter[str] = Counter()
+        self._lock = threading.Lock()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as db:
+            db.executescript(_SCHEMA)
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        db = sqlite3.connect(self.path, timeout=30)
+        try:
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    def _count(self, outcome: str, amount: int = 1) -> None:
+        with self._lock:
+            self.stats[outcome] += amount
+
+    def get(
+        self,
+        url: str,
+        *,
+        headers: Optional[Mapping[str, str]] = None,
+        timeout: Optional[float] = None,
+        fetch: Optional[Callable[..., requests.Response]] = None,
+    ) -> requests.Response:
+        """GET a URL, answering from the cache when possible.
+
+        :param url: URL to retrieve
+        :param headers: Additional request headers
+        :param timeout: Timeout for the request, if one is needed; defaults to
+            the timeout of the session making the request
+        :param fetch: Function used to make the request; defaults to the `get`
+            method of the shared "web" session
+
+        :returns: The response, either from the network or rebuilt from the
+            cache. Only successful responses are cached.
+        """
+        with self._connect() as db:
+            row = db.execute(
+                "SELECT status_code, headers, body, etag, last_modified, expires_at "
+                "FROM responses JOIN documents USING (content_hash) WHERE url = ?",
+                (url,),
+            ).fetchone()
+
+            now = time.time()
+            request_headers = dict(headers or {})
+            if row:
+                status_code, stored_headers, body, etag, last_modified, expires = row
+                body = zlib.decompress(body)
+                if expires > now:
+                    db.execute(
+                        "UPDATE responses SET last_access = ? WHERE url = ?",
+                        (now, url),
+                    )
+                    self._count("hits")
+                    logger.debug("HTTP cache hit for %s", url)
+                    return self._build_response(
+                        url, status_code, json.loads(stored_headers), body
+                    )
+                if etag:
+                    request_headers["If-None-Match"] = etag
+                if last_modified:
+                    request_headers["If-Modified-Since"] = last_modified
+
+        fetch = fetch or get_http_session("web").get
+        response = fetch(url, headers=request_headers, timeout=timeout)
+
+        if row and response.status_code == 304:
+            merged = json.loads(stored_headers)
+            merged.update(self._headers_to_store(response.headers))
+            self._store(url, status_code, merged, body)
+            self._count("revalidated")
+            logger.debug("HTTP cache revalidated %s", url)
+            return self._build_response(url, status_code, merged, body)
+
+        self._count("misses")
+        if response.status_code == 200:
+            directives = _parse_cache_control(response.headers.get("Cache-Control", ""))
+            if "no-store" not in directives:
+                self._store(
+                    url,
+                    response.status_code,
+                    self._headers_to_store(response.headers),
+                    response.content,
+                )
+        return response
+
+    def lookup(self, url: str) -> Optional[StoredDocument]:
+        """Return the last stored copy of a URL, fresh or not, without fetching."""
+        with self._connect() as db:
+            row = db.execute(
+                "SELECT content_hash, status_code, headers, body, stored_at "
+                "FROM responses JOIN documents USING (content_hash) WHERE url = ?",
+                (url,),
+            ).fetchone()
+            if not row:
+                return None
+            db.execute(
+                "UPDATE responses SET last_access = ? WHERE url = ?",
+                (time.time(), url),
+            )
+        content_hash, status_code, headers, body, stored_at = row
+        return StoredDocument(
+            url=url,
+            content_hash=content_hash,
+            status_code=status_code,
+            headers=json.loads(headers),
+            body=zlib.decompress(body),
+            stored_at=stored_at,
+        )
+
+    def lookup_extraction(
+        self, content_hash: str, extractor: str
+    ) -> Optional[Extraction]:
+        """Return what an extractor made of a stored document, if it is known.
+
+        :param content_hash: SHA-256 of the document body
+        :param extractor: Name and version of the extractor
+        """
+        with self._connect() as db:
+            row = db.execute(
+                "SELECT text, date FROM extractions "
+                "WHERE content_hash = ? AND extractor = ?",
+                (content_hash, extractor),
+            ).fetchone()
+        if not row:
+            return None
+        self._count("extraction_hits")
+        text, date = row
+        return Extraction(
+            text=zlib.decompress(text).decode("utf-8") if text is not None else None,
+            date=date,
+        )
+
+    def store_extraction(
+        self, content_hash: str, extractor: str, extraction: Extraction
+    ) -> None:
+        """Keep what an extractor made of a document, while the document is stored."""
+        text = extraction.text
+        compressed = (
+            zlib.compress(text.encode("utf-8"), COMPRESSION_LEVEL)
+            if text is not None
+            else None
+        )
+        with self._connect() as db:
+            db.execute(
+                "INSERT OR REPLACE INTO extractions (content_hash, extractor, text, date) "
+                "SELECT ?, ?, ?, ? WHERE EXISTS "
+                "(SELECT 1 FROM documents WHERE content_hash = ?)",
+                (content_hash, extractor, compressed, extraction.date, content_hash),
+            )
+
+    @staticmethod
+    def _headers_to_store(headers: Mapping[str, str]) -> dict[str, str]:
+        return {name: headers[name] for name in _STORED_HEADERS if name in headers}
+
+    @staticmethod
+    def _build_response(
+        url: str, status_code: int, headers: dict[str, str], body: bytes
+    ) -> requests.Response:
+        response = requests.Response()
+        response.url = url
+        response.status_code = status_code
+        response.headers = CaseInsensitiveDict(headers)
+        response.encoding = get_encoding_from_headers(response.headers)
+        response._content = body  # pylint: disable=protected-access
+        return response
+
+    def _store(
+        self, url: str, status_code: int, headers: dict[str, str], body: bytes
+    ) -> None:
+        content_hash = hashlib.sha256(body).hexdigest()
+        now = time.time()
+        expires = now + freshness_lifetime(headers, self.default_ttl)
+        with self._connect() as db:
+            previous = db.execute(
+                "SELECT content_hash FROM responses WHERE url = ?", (url,)
+            ).fetchone()
+            known = db.execute(
+                "SELECT 1 FROM documents WHERE content_hash = ?", (content_hash,)
+            ).fetchone()
+            if not known:
+                compressed = zlib.compress(body, COMPRESSION_LEVEL)
+                if len(compressed) > self.max_bytes:
+                    return
+                # Another thread may store the same body between the SELECT
+                # and here; then its row is the one kept
+                known = not db.execute(
+                    "INSERT OR IGNORE INTO documents "
+                    "(content_hash, body, size, stored_size) VALUES (?, ?, ?, ?)",
+                    (content_hash, compressed, len(body), len(compressed)),
+                ).rowcount
+            # A revalidated body was already this URL's, so nothing is saved
+            if known and (previous is None or previous[0] != content_hash):
+                self._count("deduplicated")
+            db.execute(
+                "INSERT OR REPLACE INTO responses "
+                "(url, status_code, headers, content_hash, etag, last_modified, "
+                "stored_at, expires_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    url,
+                    status_code,
+                    json.dumps(headers),
+                    content_hash,
+                    headers.get("ETag"),
+                    headers.get("Last-Modified"),
+                    now,
+                    expires,
+                    now,
+                ),
+            )
+            if previous and previous[0] != content_hash:
+                self._drop_orphan(db, previous[0])
+            self._evict(db)
+
+    @staticmethod
+    def _drop_orphan(db: sqlite3.Connection, content_hash: str) -> int:
+        """Delete a document no URL refers to any more; return the space freed."""
+        if db.execute(
+            "SELECT 1 FROM responses WHERE content_hash = ? LIMIT 1", (content_hash,)
+        ).fetchone():
+            return 0
+        row = db.execute(
+            "SELECT stored_size FROM documents WHERE content_hash = ?", (content_hash,)
+        ).fetchone()
+        db.execute("DELETE FROM extractions WHERE content_hash = ?", (content_hash,))
+        db.execute("DELETE FROM documents WHERE content_hash = ?", (content_hash,))
+        return row[0] if row else 0
+
+    def _evict(self, db: sqlite3.Connection) -> None:
+        (total,) = db.execute(
+            "SELECT COALESCE(SUM(stored_size), 0) FROM documents"
+        ).fetchone()
+        if total <= self.max_bytes:
+            return
+        evicted = 0
+        for url, content_hash in db.execute(
+            "SELECT url, content_hash FROM responses ORDER BY last_access"
+        ).fetchall():
+            if total <= self.max_bytes:
+                break
+            db.execute("DELETE FROM responses WHERE url = ?", (url,))
+            total -= self._drop_orphan(db, content_hash)
+            evicted += 1
+        self._count("evicted", evicted)
+        logger.debug("HTTP cache evicted %s entries", evicted)
+
+
+_cache: HttpCache | None = None
+_cache_lock = threading.Lock()
+
+
+def get_http_cache(config: Config | None = None) -> HttpCache:
+    """Return the process-wide HTTP cache."""
+    global _cache
+
+    with _cache_lock:
+        if _cache is None:
+            config = config or get_config()
+            cache_file = config.kmtools.http_cache_file.expanduser()
+            if not cache_file.is_absolute():
+                cache_file = config.config_dir / cache_file
+            _cache = HttpCache(
+                cache_file,
+                max_bytes=config.kmtools.http_cache_max_bytes,
+                default_ttl=config.kmtools.http_cache_default_ttl,
+            )
+    return _cache
+
+
+def cached_get(url: str, **kwargs) -> requests.Response:
+    """GET a URL through the process-wide HTTP cache.
+
+    Takes the same keyword arguments as `HttpCache.get()`.
+    """
+    return get_http_cache().get(url, **kwargs)
+
+
+def lookup_document(url: str) -> Optional[StoredDocument]:
+    """Return the last stored copy of a URL from the process-wide cache."""
+    return get_http_cache().lookup(url)
+
+
+def lookup_extraction(content_hash: str, extractor: str) -> Optional[Extraction]:
+    """Return a stored extraction from the process-wide cache."""
+    return get_http_cache().lookup_extraction(content_hash, extractor)
+
+
+def store_extraction(content_hash: str, extractor: str, extraction: Extraction) -> None:
+    """Keep an extraction in the process-wide cache."""
+    get_http_cache().store_extraction(content_hash, extractor, extraction)
+
+
+def log_cache_stats() -> None:
+    """Report this run's cache hits and misses, if the cache was used."""
+    if _cache is None or not _cache.stats:
+        return
+    logger.info(
+        "HTTP cache: %s hits, %s revalidated, %s misses, %s deduplicated, "
+        "%s evicted, %s extractions reused",
+        _cache.stats["hits"],
+        _cache.stats["revalidated"],
+        _cache.stats["misses"],
+        _cache.stats["deduplicated"],
+        _cache.stats["evicted"],
+        _cache.stats["extraction_hits"],
+    )
@@ -0,0 +1,126 @@
+"""Shared, pooled HTTP sessions for outbound calls.
+
+Every external service gets its own `requests.Session`, created on first use
+and reused for the rest of the process. Reusing the session keeps TCP and TLS
+connections alive between requests to the same host, and lets each service
+have its own connection pool, retry policy and default timeout.
+
+GET and HEAD are retried on connection errors, 429 and 5xx, except for
+services whose `http.service_retries` is 0, like the paid Kagi API. Waits
+asked for by `Retry-After` are capped at `http.max_retry_after`, so a rate
+limited API can't stall a run for minutes.
+
+A retried GET that runs out of retries on a read timeout raises
+`requests.ConnectionError`, not `requests.ReadTimeout`; see `timed_out()`.
+
+Usage:
+
+    r = get_http_session("wayback").get(url, headers=headers)
+
+"""
+
+from __future__ import annotations
+
+import logging
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import TimeoutError as Urllib3TimeoutError
+from urllib3.util.retry import Retry
+
+from .config import Config, get_config
+
+logger = logging.getLogger(__name__)
+
+
+class TimeoutSession(requests.Session):
+    """A `requests.Session` that applies a default timeout to every request."""
+
+    def __init__(self, timeout: float) -> None:
+        super().__init__()
+        self.timeout = timeout
+
+    def request(self, method, url, *args, **kwargs):  # pylint: disable=arguments-differ
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = self.timeout
+        return super().request(method, url, *args, **kwargs)
+
+
+class CappedRetry(Retry):
+    """A urllib3 `Retry` that waits at most `max_retry_after` for Retry-After."""
+
+    def __init__(self, *args, max_retry_after: float = 10, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.max_retry_after = max_retry_after
+
+    def new(self, **kwargs) -> "CappedRetry":
+        retry = super().new(**kwargs)
+        retry.max_retry_after = self.max_retry_after
+        return retry
+
+    def get_retry_after(self, response) -> float | None:
+        retry_after = super().get_retry_after(response)
+        if retry_after is None:
+            return None
+        return min(retry_after, self.max_retry_after)
+
+
+def timed_out(ex: requests.RequestException) -> bool:
+    """Return whether a request failed because it timed out, retried or not."""
+    if isinstance(ex, requests.Timeout):
+        return True
+    reason = getattr(ex.args[0], "reason", None) if ex.args else None
+    return isinstance(reason, Urllib3TimeoutError)
+
+
+_sessions: dict[str, TimeoutSession] = {}
+_sessions_lock = threading.Lock()
+
+
+def _build_session(service: str, config: Config) -> TimeoutSession:
+    settings = config.http
+    session = TimeoutSession(
+        timeout=settings.timeouts.get(service, settings.default_timeout)
+    )
+    # Only idempotent requests are retried automatically; a retried POST to
+    # Save Page Now would start a second capture.
+    retries = CappedRetry(
+        total=settings.service_retries.get(service, settings.retries),
+        backoff_factor=settings.backoff_factor,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=("GET", "HEAD"),
+        respect_retry_after_header=True,
+        raise_on_status=False,
+        max_retry_after=settings.max_retry_after,
+    )
+    adapter = HTTPAdapter(
+        pool_connections=settings.pool_connections,
+        pool_maxsize=settings.pool_maxsize,
+        max_retries=retries,
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    logger.debug("Created HTTP session for %s", service)
+    return session
+
+
+def get_http_session(service: str, config: Config | None = None) -> requests.Session:
+    """Return the process-wide session for an external service.
+
+    :param service: Service name, such as "pinboard", "hypothesis", "kagi",
+        "wayback", or "web" for arbitrary web pages
+    :param config: Configuration to use if the session must be created
+    """
+    with _sessions_lock:
+        if service not in _sessions:
+            _sessions[service] = _build_session(service, config or get_config())
+        return _sessions[service]
+
+
+def close_http_sessions() -> None:
+    """Close all sessions and their pooled connections."""
+    with _sessions_lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
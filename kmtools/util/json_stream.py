@@ -0,0 +1,119 @@
+"""Incremental parsing of large JSON documents."""
+
+from __future__ import annotations
+
+import codecs
+import json
+from typing import Any, Collection, Iterable, Iterator
+
+_WHITESPACE = " \t\n\r"
+
+
+class _StreamBuffer:
+    """Decoded text of a chunked document, refilled on demand."""
+
+    def __init__(self, chunks: Iterable[bytes]) -> None:
+        self._chunks = iter(chunks)
+        self._text_decoder = codecs.getincrementaldecoder("utf-8")()
+        self._json_decoder = json.JSONDecoder()
+        self.text = ""
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self) -> bool:
+        if self.eof:
+            return False
+        try:
+            decoded = self._text_decoder.decode(next(self._chunks))
+        except StopIteration:
+            decoded = self._text_decoder.decode(b"", final=True)
+            self.eof = True
+        # Drop what has been consumed so the buffer stays small
+        self.text = self.text[self.pos :] + decoded
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        """Return the next non-whitespace character, or "" at the end."""
+        while True:
+            while self.pos < len(self.text) and self.text[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.text):
+                return self.text[self.pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, char: str) -> None:
+        if self.peek() != char:
+            raise ValueError(f"Expected {char!r} in JSON document")
+        self.pos += 1
+
+    def decode(self) -> Any:
+        """Decode the next complete JSON value."""
+        self.peek()
+        while True:
+            try:
+                value, end = self._json_decoder.raw_decode(self.text, self.pos)
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise ValueError("Truncated or malformed JSON document") from None
+            else:
+                # A bare number or literal at the end of the buffer might
+                # continue in the next chunk
+                if (
+                    end < len(self.text)
+                    or self.eof
+                    or isinstance(value, (dict, list, str))
+                ):
+                    self.pos = end
+                    return value
+            self._fill()
+
+
+def iter_json_array(
+    chunks: Iterable[bytes], keys: Collection[str] = ()
+) -> Iterator[Any]:
+    """
+    Yield the elements of a JSON array as they arrive.
+
+    Only the element currently being decoded is held in memory, so a
+    multi-megabyte response or export file can be processed with a small,
+    constant footprint.
+
+    Args:
+        chunks: UTF-8 encoded pieces of the document, for instance from
+            `requests.Response.iter_content()`.
+        keys: If the document is an object rather than an array, read the
+            array stored under the first of these keys to appear.
+
+    Raises:
+        ValueError: The document isn't of the expected shape or is truncated.
+
+    Example:
+        with requests.get(url, stream=True, timeout=30) as r:
+            for item in iter_json_array(r.iter_content(65536)):
+                ...
+    """
+    buffer = _StreamBuffer(chunks)
+
+    if keys and buffer.peek() == "{":
+        buffer.expect("{")
+        while True:
+            if buffer.peek() != '"':
+                raise ValueError(f"None of {', '.join(keys)} found in JSON document")
+            name = buffer.decode()
+            buffer.expect(":")
+            if name in keys:
+                break
+            buffer.decode()  # Skip the value of any other member
+            if buffer.peek() == ",":
+                buffer.expect(",")
+
+    buffer.expect("[")
+    if buffer.peek() == "]":
+        return
+    while True:
+        yield buffer.decode()
+        if buffer.peek() == "]":
+            return
+        buffer.expect(",")
@@ -0,0 +1,124 @@
+"""Lazily loaded natural language resources.
+
+NLTK and trafilatura are slow to import and their data is slow to load, yet
+most kmtools commands never summarize anything. Everything here is imported
+and loaded on first use and then kept for the life of the process:
+
+- `stopwords()`: the English stopword set
+- `sent_tokenize()` / `word_tokenize()`: NLTK's Punkt sentence splitter and
+  Treebank word tokenizer, giving the same tokens as `nltk.sent_tokenize()`
+  and `nltk.word_tokenize()`
+- `trafilatura_config()`: trafilatura's settings
+
+When the NLTK stopwords aren't installed they fall back to a copy of NLTK's
+English list. There is no fallback for the Punkt sentence model: an untrained
+tokenizer splits sentences differently, which would change summaries without
+notice, so `require_sentence_model()` raises instead. `prewarm()` loads it all
+up front, for instance in a worker process before its first task.
+"""
+
+from __future__ import annotations
+
+import functools
+import importlib
+import logging
+import time
+from typing import TYPE_CHECKING, FrozenSet, List
+
+if TYPE_CHECKING:
+    from configparser import ConfigParser
+
+logger = logging.getLogger(__name__)
+
+# NLTK's English stopword list, for when the NLTK data isn't installed
+VENDORED_STOPWORDS = frozenset("""
+    a about above after again against ain all am an and any are aren aren't as
+    at be because been before being below between both but by can couldn
+    couldn't d did didn didn't do does doesn doesn't doing don don't down
+    during each few for from further had hadn hadn't has hasn hasn't have
+    haven haven't having he he'd he'll he's her here hers herself him himself
+    his how i i'd i'll i'm i've if in into is isn isn't it it'd it'll it's its
+    itself just ll m ma me mightn mightn't more most mustn mustn't my myself
+    needn needn't no nor not now o of off on once only or other our ours
+    ourselves out over own re s same shan shan't she she'd she'll she's should
+    should've shouldn shouldn't so some such t than that that'll the their
+    theirs them themselves then there these they they'd they'll they're
+    they've this those through to too under until up ve very was wasn wasn't
+    we we'd we'll we're we've were weren weren't what when where which while
+    who whom why will with won won't wouldn wouldn't y you you'd you'll you're
+    you've your yours yourself yourselves
+    """.split())
+
+
+@functools.cache
+def stopwords() -> FrozenSet[str]:
+    """Return the English stopwords."""
+    import nltk  # pylint: disable=import-outside-toplevel
+
+    try:
+        return frozenset(nltk.corpus.stopwords.words("english"))
+    except LookupError:
+        logger.info("NLTK stopwords not installed; using the vendored list")
+        return VENDORED_STOPWORDS
+
+
+@functools.cache
+def _sentence_tokenizer():
+    from nltk.tokenize import (  # pylint: disable=import-outside-toplevel
+        PunktTokenizer,
+    )
+
+    try:
+        return PunktTokenizer("english")
+    except LookupError as e:
+        raise LookupError(
+            "NLTK's English punkt_tab model isn't installed; "
+            "install it with `python -m nltk.downloader punkt_tab`"
+        ) from e
+
+
+def require_sentence_model() -> None:
+    """Raise LookupError now if the Punkt sentence model isn't installed."""
+    _sentence_tokenizer()
+
+
+@functools.cache
+def _word_tokenizer():
+    from nltk.tokenize import (  # pylint: disable=import-outside-toplevel
+        NLTKWordTokenizer,
+    )
+
+    return NLTKWordTokenizer()
+
+
+def sent_tokenize(text: str) -> List[str]:
+    """Split English text into sentences."""
+    return _sentence_tokenizer().tokenize(text)
+
+
+def word_tokenize(text: str) -> List[str]:
+    """Split English text into words and punctuation."""
+    tokenizer = _word_tokenizer()
+    return [token for sent in sent_tokenize(text) for token in tokenizer.tokenize(sent)]
+
+
+@functools.cache
+def trafilatura_config() -> ConfigParser:
+    """Return trafilatura's default settings."""
+    from trafilatura.settings import (  # pylint: disable=import-outside-toplevel
+        use_config,
+    )
+
+    return use_config()
+
+
+def prewarm() -> None:
+    """Import and load every resource now rather than on first use."""
+    started = time.perf_counter()
+    importlib.import_module("trafilatura")
+
+    stopwords()
+    _sentence_tokenizer()
+    _word_tokenizer()
+    trafilatura_config()
+    logger.debug("NLP resources loaded in %.2fs", time.perf_counter() - started)
@@ -0,0 +1,54 @@
+"""Text and dates from PDF documents.
+
+Uses the optional `pypdf` package (`pip install kmtools[pdf]`). Without it,
+PDFs have no text and are left unsummarized.
+"""
+
+from __future__ import annotations
+
+import io
+import logging
+from itertools import islice
+from typing import Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def _reader(downloaded: bytes):
+    try:
+        import pypdf  # pylint: disable=import-outside-toplevel
+    except ImportError:
+        logger.info("Install the pypdf package to summarize PDF documents")
+        return None
+    try:
+        return pypdf.PdfReader(io.BytesIO(downloaded))
+    except pypdf.errors.PyPdfError as e:
+        logger.info("Couldn't read PDF: %s", e)
+        return None
+
+
+def read_pdf(downloaded: bytes, max_pages: int) -> Tuple[Optional[str], Optional[str]]:
+    """Return the text of the first pages of a PDF and its creation date.
+
+    Either is None if the PDF doesn't have it or can't be read.
+
+    :param downloaded: The PDF
+    :param max_pages: Number of pages to read
+
+    :returns: The text, and the date as YYYY-MM-DD
+    """
+    reader = _reader(downloaded)
+    if reader is None:
+        return None, None
+    # pypdf raises a variety of errors on malformed documents
+    try:
+        pages = [page.extract_text() or "" for page in islice(reader.pages, max_pages)]
+        text = "\n".join(pages).strip() or None
+    except Exception as e:  # pylint: disable=broad-exception-caught
+        logger.info("Couldn't extract text from PDF: %s", e)
+        text = None
+    try:
+        created = reader.metadata.creation_date if reader.metadata else None
+    except Exception:  # pylint: disable=broad-exception-caught
+        created = None
+    return text, created.date().isoformat() if created else None
@@ -0,0 +1,110 @@
+"""Process pool whose tasks run under CPU-time and memory limits.
+
+CPU-bound work on untrusted input, like parsing arbitrary web pages, can spin
+or balloon on a pathological document. Running it in worker processes keeps
+the main process responsive, and resource limits keep one bad task from
+hanging or exhausting the whole run:
+
+- Each task gets a soft `RLIMIT_CPU` of `cpu_seconds` beyond what its worker
+  has already used. Going over raises `TaskLimitError` inside the task.
+- A task stuck in C code can't see that exception, so each worker also has a
+  hard CPU limit covering all of its tasks; the kernel kills the worker when
+  it is reached, and the pool reports it as broken.
+- `RLIMIT_AS` caps the memory of each worker; allocations beyond it fail with
+  `MemoryError`.
+
+An optional `warmup` function runs as each worker starts, before any limit is
+set, so slow imports and model loading aren't charged to the first task.
+
+Usage:
+
+    with limited_process_pool(workers=4, memory_bytes=2**30, cpu_seconds=30) as pool:
+        future = pool.submit(run_limited, 30, parse, document)
+"""
+
+from __future__ import annotations
+
+import logging
+import resource
+import signal
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, TypeVar
+
+from kmtools.exceptions import TaskLimitError
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Extra seconds a worker may run past its tasks' allowance before being killed
+HARD_LIMIT_GRACE = 5
+
+
+def _cpu_used() -> float:
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def _on_sigxcpu(signum, frame):  # pylint: disable=unused-argument
+    raise TaskLimitError("CPU time limit exceeded")
+
+
+def _init_worker(
+    memory_bytes: int | None,
+    lifetime_cpu_seconds: float,
+    warmup: Callable[[], None] | None,
+) -> None:
+    if warmup:
+        warmup()
+    signal.signal(signal.SIGXCPU, _on_sigxcpu)
+    hard = int(_cpu_used() + lifetime_cpu_seconds + HARD_LIMIT_GRACE)
+    try:
+        resource.setrlimit(resource.RLIMIT_CPU, (hard, hard))
+        if memory_bytes:
+            resource.setrlimit(resource.RLIMIT_AS, (memory_bytes, memory_bytes))
+    except (ValueError, OSError) as e:
+        # Not every platform enforces every limit (macOS ignores RLIMIT_AS)
+        logger.debug("Couldn't set worker resource limits: %s", e)
+
+
+def run_limited(cpu_seconds: float, func: Callable[..., T], *args: Any) -> T:
+    """Run a function in a pool worker with a CPU-time allowance.
+
+    :raises TaskLimitError: if the function uses more than `cpu_seconds` of
+        CPU time or runs out of memory
+    """
+    _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+    soft = int(_cpu_used() + cpu_seconds) + 1
+    if hard != resource.RLIM_INFINITY:
+        soft = min(soft, hard)
+    resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+    try:
+        return func(*args)
+    except MemoryError as e:
+        raise TaskLimitError("Memory limit exceeded") from e
+    finally:
+        resource.setrlimit(resource.RLIMIT_CPU, (hard, hard))
+
+
+def limited_process_pool(
+    workers: int,
+    cpu_seconds: float,
+    memory_bytes: int | None = None,
+    tasks_per_worker: int = 10,
+    warmup: Callable[[], None] | None = None,
+) -> ProcessPoolExecutor:
+    """Create a process pool for use with `run_limited()`.
+
+    :param workers: Number of worker processes
+    :param cpu_seconds: CPU time allowed per task
+    :param memory_bytes: Address space allowed per worker, or None
+    :param tasks_per_worker: Tasks a worker runs before it is replaced, which
+        bounds the hard CPU limit of each worker
+    :param warmup: Function each worker runs when it starts, or None
+    """
+    return ProcessPoolExecutor(
+        max_workers=workers,
+        max_tasks_per_child=tasks_per_worker,
+        initializer=_init_worker,
+        initargs=(memory_bytes, cpu_seconds * tasks_per_worker, warmup),
+    )
@@ -0,0 +1,135 @@
+"""Corpus-wide document-frequency index over extracted texts.
+
+Summaries that weigh words against the whole corpus need to know how many
+documents contain each word. Rather than re-reading every document, the
+index is kept up to date as documents are summarized:
+
+- `term` gives each distinct word a compact integer ID and counts the
+  documents that contain it.
+- `indexed_document` keeps the sorted term IDs of each resource, so that
+  when its text changes only the difference is applied to the counts.
+
+Indexing a document costs time in proportion to its number of distinct
+terms. `load_corpus()` takes a snapshot of the counts for scoring.
+"""
+
+from __future__ import annotations
+
+import logging
+import math
+import struct
+from dataclasses import dataclass
+from typing import Dict, Iterable, Iterator, List, Set
+
+from sqlalchemy import func, select, update
+from sqlalchemy.orm import Session
+
+from kmtools.models import IndexedDocument, Term
+
+logger = logging.getLogger(__name__)
+
+# Keeps IN (...) lists well inside SQLite's limit on bound parameters
+CHUNK_SIZE = 500
+
+# Term IDs are packed as little-endian unsigned 32-bit integers, whatever
+# the platform's native int size and byte order
+_TERM_ID = struct.Struct("<I")
+
+
+@dataclass(frozen=True)
+class CorpusStats:
+    """Snapshot of the index: the number of documents and each term's count."""
+
+    document_count: int
+    frequencies: Dict[str, int]
+
+    def idf(self, term: str) -> float:
+        """Return the smoothed inverse document frequency of a term.
+
+        Unseen terms get the highest weight; an empty index weighs every
+        term the same.
+        """
+        return (
+            math.log((1 + self.document_count) / (1 + self.frequencies.get(term, 0)))
+            + 1
+        )
+
+
+def _chunks(items: List, size: int = CHUNK_SIZE) -> Iterator[List]:
+    for start in range(0, len(items), size):
+        yield items[start : start + size]
+
+
+def _pack(term_ids: Iterable[int]) -> bytes:
+    sorted_ids = sorted(term_ids)
+    return struct.pack(f"<{len(sorted_ids)}I", *sorted_ids)
+
+
+def _unpack(packed: bytes) -> Set[int]:
+    return {term_id for (term_id,) in _TERM_ID.iter_unpack(packed)}
+
+
+def _term_ids(session: Session, terms: Set[str]) -> Dict[str, int]:
+    """Return the IDs of terms, adding the ones the index hasn't seen."""
+    ids: Dict[str, int] = {}
+    for chunk in _chunks(sorted(terms)):
+        ids.update(
+            session.execute(
+                select(Term.term, Term.id).where(Term.term.in_(chunk))
+            ).all()
+        )
+    new_terms = [Term(term=term, document_count=0) for term in terms - ids.keys()]
+    if new_terms:
+        session.add_all(new_terms)
+        session.flush()
+        ids.update((term.term, term.id) for term in new_terms)
+    return ids
+
+
+def _adjust_counts(session: Session, term_ids: Set[int], delta: int) -> None:
+    for chunk in _chunks(sorted(term_ids)):
+        session.execute(
+            update(Term)
+            .where(Term.id.in_(chunk))
+            .values(document_count=Term.document_count + delta)
+        )
+
+
+def index_document(session: Session, resource_id: int, terms: Iterable[str]) -> None:
+    """Count a resource's extracted text in the index, replacing any earlier text.
+
+    The session is not committed.
+
+    :param session: SQLAlchemy session
+    :param resource_id: ID of the WebResource the text belongs to
+    :param terms: The words of the text; repeats are ignored
+    """
+    term_ids = set(_term_ids(session, set(terms)).values())
+    document = session.get(IndexedDocument, resource_id)
+    old_term_ids = _unpack(document.term_ids) if document else set()
+
+    _adjust_counts(session, term_ids - old_term_ids, 1)
+    _adjust_counts(session, old_term_ids - term_ids, -1)
+
+    if document is None:
+        document = IndexedDocument(resource_id=resource_id)
+        session.add(document)
+    document.term_ids = _pack(term_ids)
+    logger.debug(
+        "Indexed %s terms for resource %s (%s added, %s removed)",
+        len(term_ids),
+        resource_id,
+        len(term_ids - old_term_ids),
+        len(old_term_ids - term_ids),
+    )
+
+
+def load_corpus(session: Session) -> CorpusStats:
+    """Return a snapshot of the index for scoring."""
+    document_count = session.scalar(select(func.count(IndexedDocument.resource_id)))
+    frequencies = dict(
+        session.execute(
+            select(Term.term, Term.document_count).where(Term.document_count > 0)
+        ).all()
+    )
+    return CorpusStats(document_count or 0, frequencies)